@@ -4,107 +4,152 @@ and 10 - 12
 """
 
 import os
+import argparse
 from pathlib import Path
 
 from processing_scripts_formose import (
     comp_info,
     data_analysis_functions,
     config_file,
-    data_report,
+    experiment_store,
     file_writers,
+    output_manifest,
     plotting_functions,
+    resampling,
 )
 
-# Get the path to the data
-config = config_file.load_config("./info_files/dir_data.csv")
 
-data_folder = Path(config["dir_extendend_data"])
-output_folder = Path(config["output_dir"])
-os.makedirs(output_folder / "statistics", exist_ok=True)
-
-exp_name = ["01_20_mM_amp", "02_50_mM_amp", "03_100_mM_amp", "04_50_mM_freq"]
-for x in exp_name:
-    os.makedirs(output_folder / "violin_plots" / f"{x}", exist_ok=True)
-
-# A list of experiment codes which will be used in the analysis.
-experiment_sets = [
-    ["EXP004", "EXP005", "EXP006"],  # 20 mM
-    ["EXP001", "EXP002", "EXP003"],  # 50 mM
-    ["EXP007", "EXP008", "EXP009"],  # 100 mM
-    ["EXP010", "EXP012", "EXP011"],  # 50 mM freq variation
-]
-
-
-# These variables can be placed in a separate configuration file.
-independent_variable_units = ["σ/ mM", "σ/ mM", "σ/ mM", "rate/ s"]
-independent_variables = [
-    ["0", "2.89", "5.75"],
-    ["0", "2.89", "5.76"],
-    ["0", "2.89", "5.77"],
-    ["0", "45", "120"],
-]
-
-
-# Load compound info
-c_info = comp_info.information("./info_files")
-compound_colours = comp_info.load_colours_dict("./info_files/compound_information.csv")
-names = dict(zip(c_info.SMILES, c_info.name))
-index = dict(zip(c_info.SMILES, c_info.ind))
-compound_numbers = list(zip(c_info.ind, c_info.SMILES))
-
-# The indices of each sequence to compare
-pair_indices = [(0, 1), (1, 2), (0, 2)]
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="rewrite all plots and statistics files, including unchanged ones",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes, 0 uses all available cores",
+    )
+    args = parser.parse_args()
 
-exp_idx = 0
-for c, set in enumerate(experiment_sets, 0):
-    current_set = []  # store for the data in each series
-    exp_n = exp_name[exp_idx]
-    for exp in set:
+    # Get the path to the data
+    config = config_file.load_config("./info_files/dir_data.csv")
 
-        # Load data
-        working_path = data_folder / exp / "Analysed_data"
+    data_folder = Path(config["dir_extendend_data"])
+    output_folder = Path(config["output_dir"])
+    os.makedirs(output_folder / "statistics", exist_ok=True)
 
-        file_name = working_path / f"{exp}_Data.csv"
+    exp_name = ["01_20_mM_amp", "02_50_mM_amp", "03_100_mM_amp", "04_50_mM_freq"]
+    for x in exp_name:
+        os.makedirs(output_folder / "violin_plots" / f"{x}", exist_ok=True)
 
-        data = data_report.data_report(file=file_name)
+    # Outputs with unchanged inputs since the last run are skipped.
+    manifest = output_manifest.output_manifest(output_folder, force=args.force)
 
-        current_set.append(data)
+    # Load the experiments in the catalog
+    store = experiment_store.experiment_store(
+        "./info_files/list_exp.csv", data_folder, workers=args.workers or None
+    )
 
-        # calculate averages and standard deviations
-        averages = data_analysis_functions.data_averages(data)
-        standard_deviations = data_analysis_functions.data_standard_deviations(data)
+    # The sets of experiments which will be used in the analysis, ordered by the
+    # amplitude and rate of the Ca(OH)2 perturbation.
+    set_names = ["20_mM_amp", "50_mM_amp", "100_mM_amp", "50_mM_freq"]
+    experiment_sets = [
+        store.select(set=s, order_by=["std_Ca(OH)2", "rate_Ca(OH)2"]) for s in set_names
+    ]
+
+    # These variables can be placed in a separate configuration file.
+    independent_variable_units = ["σ/ mM", "σ/ mM", "σ/ mM", "rate/ s"]
+    independent_variables = [
+        ["0", "2.89", "5.75"],
+        ["0", "2.89", "5.76"],
+        ["0", "2.89", "5.77"],
+        ["0", "45", "120"],
+    ]
+
+    # Load compound info
+    c_info = comp_info.information("./info_files")
+    compound_colours = comp_info.load_colours_dict(
+        "./info_files/compound_information.csv"
+    )
+    names = dict(zip(c_info.SMILES, c_info.name))
+    index = dict(zip(c_info.SMILES, c_info.ind))
+    compound_numbers = list(zip(c_info.ind, c_info.SMILES))
+
+    # The indices of each sequence to compare
+    pair_indices = [(0, 1), (1, 2), (0, 2)]
+
+    # Bootstrap confidence intervals of the averages of all experiments in the
+    # sets. The traces are autocorrelated, so blocks of timepoints are resampled.
+    n_resamples = 10000
+    set_experiments = [exp for set in experiment_sets for exp in set]
+    intervals = resampling.mean_confidence_intervals(
+        [store.reports[exp].data.array for exp in set_experiments],
+        n_resamples=n_resamples,
+        block_size=None,
+        workers=args.workers or None,
+    )
+    mean_intervals = dict(zip(set_experiments, intervals))
+
+    exp_idx = 0
+    for c, set in enumerate(experiment_sets, 0):
+        current_set = []  # store for the data in each series
+        exp_n = exp_name[exp_idx]
+        for exp in set:
+
+            data = store.reports[exp]
+
+            current_set.append(data)
+
+            # calculate averages and standard deviations
+            averages = data_analysis_functions.data_averages(data)
+            standard_deviations = data_analysis_functions.data_standard_deviations(data)
+            confidence_intervals = dict(zip(data.data, zip(*mean_intervals[exp])))
+
+            # write the averages and standard deviations to files
+            statistics_file = output_folder / "statistics" / f"{exp}_statistics.csv"
+            key = output_manifest.input_hash(
+                averages, standard_deviations, index, confidence_intervals
+            )
+            if manifest.is_current(statistics_file, key):
+                print(f"Results up to date: {statistics_file}")
+            else:
+                file_writers.write_average_stdev_csv(
+                    averages,
+                    standard_deviations,
+                    index,
+                    filename=statistics_file,
+                    confidence_intervals=confidence_intervals,
+                )
+                manifest.record(statistics_file, key)
+
+        # Calculate p_values for all pairs in the set
+        p_values = data_analysis_functions.series_p_values(
+            current_set, pair_indices, compound_numbers
+        )
 
-        # write the averages and standard deviations to files
-        file_writers.write_average_stdev_csv(
-            averages,
-            standard_deviations,
-            index,
-            filename=output_folder / "statistics" / f"{exp}_statistics.csv",
+        # Generate violin plots
+        plotting_functions.create_series_violin_plots(
+            current_set,
+            compound_colours=compound_colours,
+            series_values=independent_variables[c],
+            x_label=independent_variable_units[c],
+            filename=str(
+                output_folder / "violin_plots" / f"{exp_n}" / f"{exp_n}_violin_plots"
+            ),
+            pairs=pair_indices,
+            p_values=p_values,
+            names=names,
+            index=index,
+            workers=args.workers or None,
+            manifest=manifest,
         )
+        exp_idx += 1
 
-    # Calculate p_values
-    p_values_1_2 = data_analysis_functions.data_p_values(
-        current_set[0], current_set[1], compound_numbers
-    )
-    p_values_2_3 = data_analysis_functions.data_p_values(
-        current_set[1], current_set[2], compound_numbers
-    )
-    p_values_1_3 = data_analysis_functions.data_p_values(
-        current_set[0], current_set[2], compound_numbers
-    )
+    manifest.save()
 
-    # Generate violin plots
-    plotting_functions.create_series_violin_plots(
-        current_set,
-        compound_colours=compound_colours,
-        series_values=independent_variables[c],
-        x_label=independent_variable_units[c],
-        filename=str(
-            output_folder / "violin_plots" / f"{exp_n}" / f"{exp_n}_violin_plots"
-        ),
-        pairs=pair_indices,
-        p_values=[p_values_1_2, p_values_2_3, p_values_1_3],
-        names=names,
-        index=index,
-    )
-    exp_idx += 1
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,104 @@
 """
-Hierarchical cluster analysis on conditions perturbed with continual
-Ca(OH)2 perturbations with multiple rates, experiment 13
+Hierarchical cluster analysis of the time traces of the experiments in the
+catalog, e.g. conditions perturbed with continual Ca(OH)2 perturbations with
+multiple rates (experiment 13)
 """
 
 import os
+import argparse
 from pathlib import Path
 
 from processing_scripts_formose import (
+    clustering,
     comp_info,
     config_file,
-    data_report,
+    data_cache,
+    experiment_store,
+    file_writers,
     plotting_functions,
 )
 
-from scipy.spatial.distance import pdist
-from scipy.cluster.hierarchy import linkage
 
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes, 0 uses all available cores",
+    )
+    parser.add_argument(
+        "--support",
+        nargs="*",
+        default=["EXP013"],
+        metavar="EXP",
+        help="experiments whose cluster support is estimated (default: EXP013)",
+    )
+    args = parser.parse_args()
 
-# Get the path to the data
-config = config_file.load_config("./info_files/dir_data.csv")
+    # Get the path to the data
+    config = config_file.load_config("./info_files/dir_data.csv")
 
-data_folder = Path(config["dir_extendend_data"])
-output_folder = Path(config["output_dir"])
-os.makedirs(output_folder / "cluster_analysis", exist_ok=True)
+    data_folder = Path(config["dir_extendend_data"])
+    output_folder = Path(config["output_dir"])
+    os.makedirs(output_folder / "cluster_analysis", exist_ok=True)
 
-# A list of experiment codes which will be used in the analysis.
-experiments = [
-    "EXP013",
-]
+    # All experiments in the catalog are clustered.
+    _, catalog = config_file.load_catalog("./info_files/list_exp.csv")
+    experiments = [row[0] for row in catalog]
 
-list_exp, exp_condition = config_file.load_exp_info(
-    "./info_files/list_exp.csv", experiments
-)
+    # Load compound info
+    c_info = comp_info.information("./info_files")
 
-# Load compound info
-c_info = comp_info.information("./info_files")
+    # clustering parameters
+    metric = "correlation"
+    algorithm = "average"
 
-# clustering parameters
-metric = "correlation"
-algorithm = "average"
+    # multiscale block bootstrap of the timepoints (resamples per scale)
+    n_resamples = 1000
 
-for exp in experiments:
-    # Set up for loading files
-    working_path = data_folder / exp / "Analysed_data"
-    file_name = working_path / f"{exp}_Data.csv"
+    # Hierarchical clustering analysis, one experiment per worker process. The
+    # distance matrices are cached next to the data reports.
+    files = [experiment_store.data_file(data_folder, exp) for exp in experiments]
+    clusters = clustering.cluster_experiments(
+        files, metric=metric, method=algorithm, workers=args.workers or None
+    )
 
-    data = data_report.data_report(file=file_name)
-    compounds = [comp.split("/")[0] for comp in data.data]
+    for exp, file, (entries, Z) in zip(experiments, files, clusters):
+        compounds = [comp.split("/")[0] for comp in entries]
+        labels = [c_info.ind[c_info.SMILES.index(comp)] for comp in compounds]
 
-    # Hierarchical clustering analysis
-    # Create the distance matrix
-    data_as_array = data.to_numpy()
-    dist_matrix = pdist(data_as_array, metric)
+        # Plot the dendrogram
+        dendrogram = plotting_functions.dendrogram_plot(
+            Z,
+            labels,
+            f"{str(output_folder)}/cluster_analysis/{exp}_dendrogram",
+        )
 
-    # Create the linkage matrix
-    Z = linkage(dist_matrix, algorithm, metric, optimal_ordering=False)
+        if exp not in args.support:
+            continue
 
-    # Plot the dendrogram
-    dendrogram = plotting_functions.dendrogram_plot(
-        Z,
-        [c_info.ind[c_info.SMILES.index(comp)] for comp in compounds],
-        f"{str(output_folder)}/cluster_analysis/{exp}_dendrogram",
-    )
+        # Stability of the clusters
+        support = clustering.multiscale_bootstrap(
+            data_cache.load_data_report(file).to_numpy(),
+            Z,
+            method=algorithm,
+            n_resamples=n_resamples,
+            workers=args.workers or None,
+        )
+        file_writers.write_cluster_support_csv(
+            Z,
+            support,
+            labels,
+            f"{str(output_folder)}/cluster_analysis/{exp}_cluster_support.csv",
+        )
+        plotting_functions.dendrogram_plot(
+            Z,
+            labels,
+            f"{str(output_folder)}/cluster_analysis/{exp}_dendrogram_support",
+            support=support,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -8,76 +8,123 @@
 """
 
 import os
+import argparse
 from pathlib import Path
 
 from processing_scripts_formose import (
     comp_info,
     data_analysis_functions,
     config_file,
-    data_report,
+    data_cache,
     file_writers,
+    resampling,
 )
+from processing_scripts_formose.data_report import compound_index
 
-# Get the path to the data
-config = config_file.load_config("./info_files/dir_data.csv")
 
-data_folder = Path(config["dir_extendend_data"])
-output_folder = Path(config["output_dir"])
-os.makedirs(output_folder / "correlation_analysis", exist_ok=True)
-
-
-# A list of experiment codes which will be used in the analysis.
-experiments = ["EXP013"]
-
-list_exp, exp_condition = config_file.load_exp_info(
-    "./info_files/list_exp.csv", experiments
-)
-
-# Load compound info
-c_info = comp_info.information("./info_files")
-
-l = list(zip(c_info.ind, c_info.SMILES))
-time_intervals = [150, 120, 90, 60, 30]  # in seconds
-sample_time = 30  # in seconds
-
-
-for exp in exp_condition:
-    working_path = data_folder / exp / "Analysed_data"
-    file_name = working_path / f"{exp}_Data.csv"
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes, 0 uses all available cores",
+    )
+    args = parser.parse_args()
 
-    data = data_report.data_report(file=file_name)
-    compounds = [*data.data]
+    # Get the path to the data
+    config = config_file.load_config("./info_files/dir_data.csv")
 
-    flow = data.conditions["NaOH_flow/ µl/h"]  # each step is 1 second
-    flow_time = data.conditions["flow_profile_time/ s"]
+    data_folder = Path(config["dir_extendend_data"])
+    output_folder = Path(config["output_dir"])
+    os.makedirs(output_folder / "correlation_analysis", exist_ok=True)
 
-    # create dictionarry with flow values at data points of sample times ###
-    flow_values = dict()
-    flow_values["data_points"] = []
-    for x in data.series_values:
-        flow_values["data_points"].append(flow[int(x)])
+    # A list of experiment codes which will be used in the analysis.
+    experiments = ["EXP013"]
 
-    # different differentials on mean bins for time intervals in 'time_intervals' ###
-    d_data = data_analysis_functions.differential_means(
-        data.data, time_intervals, sample_time, l
-    )
-    d_flow = data_analysis_functions.differential_means(
-        flow_values, time_intervals, sample_time, [("no_ind", "data_points")]
+    list_exp, exp_condition = config_file.load_exp_info(
+        "./info_files/list_exp.csv", experiments
     )
 
-    # Pearson correlation analysis for different time scales ###
-    corr = data_analysis_functions.correlation(d_data, d_flow, time_intervals)
-
-    indexes = []
-    for a, b in l:
-        for x in [*data.data]:
-            if b in x:
-                indexes.append(a)
-
-    # file writer   ['correlation_value','hex_colour']
-    file_writers.write_corr_csv(
-        corr,
-        time_intervals,
-        indexes,
-        filename=output_folder / "correlation_analysis" / f"correlation_analysis.csv",
-    )
+    # Load compound info
+    c_info = comp_info.information("./info_files")
+
+    l = list(zip(c_info.ind, c_info.SMILES))
+    time_intervals = [150, 120, 90, 60, 30]  # in seconds
+    sample_time = 30  # in seconds
+    n_surrogates = 10000  # for the significance of the correlations
+
+    for exp in exp_condition:
+        working_path = data_folder / exp / "Analysed_data"
+        file_name = working_path / f"{exp}_Data.csv"
+
+        data = data_cache.load_data_report(file_name)
+        compounds = [*data.data]
+
+        flow = data.conditions["NaOH_flow/ µl/h"]  # each step is 1 second
+        flow_time = data.conditions["flow_profile_time/ s"]
+
+        # create dictionarry with flow values at data points of sample times ###
+        flow_values = dict()
+        flow_values["data_points"] = []
+        for x in data.series_values:
+            flow_values["data_points"].append(flow[int(x)])
+
+        # different differentials on mean bins for time intervals in 'time_intervals' ###
+        d_data = data_analysis_functions.differential_means(
+            data.data, time_intervals, sample_time, l
+        )
+        d_flow = data_analysis_functions.differential_means(
+            flow_values, time_intervals, sample_time, [("no_ind", "data_points")]
+        )
+
+        # Pearson correlation analysis for different time scales ###
+        corr = data_analysis_functions.correlation(d_data, d_flow, time_intervals)
+
+        compound_rows = compound_index(data.data)
+        indexes = [a for a, b in l if b in compound_rows]
+
+        # file writer   ['correlation_value','hex_colour']
+        file_writers.write_corr_csv(
+            corr,
+            time_intervals,
+            indexes,
+            filename=output_folder
+            / "correlation_analysis"
+            / f"correlation_analysis.csv",
+        )
+
+        # significance of the correlations against circularly shifted flow
+        # differentials, which keep their autocorrelation
+        p_values = resampling.correlation_p_values(
+            d_data,
+            d_flow,
+            n_surrogates=n_surrogates,
+            seed=0,
+            workers=args.workers or None,
+        )
+
+        file_writers.write_corr_p_values_csv(
+            p_values,
+            time_intervals,
+            indexes,
+            filename=output_folder
+            / "correlation_analysis"
+            / "correlation_significance.csv",
+        )
+
+        # correlation at lags up to the residence time of the reactor
+        max_lag = data_analysis_functions.residence_time_lag(data, sample_time)
+        lagged = data_analysis_functions.lagged_correlations(d_data, d_flow, max_lag)
+
+        file_writers.write_lagged_corr_csv(
+            lagged["peak_r"],
+            lagged["peak_lag"] * sample_time,
+            time_intervals,
+            indexes,
+            filename=output_folder / "correlation_analysis" / "lagged_correlation.csv",
+        )
+
+
+if __name__ == "__main__":
+    main()
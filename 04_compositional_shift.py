@@ -8,84 +8,110 @@ Composition shift from steady state on data sets with combined experiments:
 """
 
 import os
+import argparse
 from pathlib import Path
 
 from processing_scripts_formose import (
     comp_info,
     data_analysis_functions,
     config_file,
-    data_report,
+    experiment_store,
     file_writers,
+    resampling,
 )
 
-# Get the path to the data
-config = config_file.load_config("./info_files/dir_data.csv")
 
-data_folder = Path(config["dir_extendend_data"])
-output_folder = Path(config["output_dir"])
-os.makedirs(output_folder / "compositional_shift", exist_ok=True)
-
-# A list of experiment codes which will be used in the analysis.
-experiment_sets = [
-    ["EXP004", "EXP005", "EXP006"],  # 20 mM
-    ["EXP001", "EXP002", "EXP003"],  # 50 mM
-    ["EXP007", "EXP008", "EXP009"],  # 100 mM
-    ["EXP010", "EXP012", "EXP011"],  # 50 mM freq variation
-]
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of worker processes, 0 uses all available cores",
+    )
+    args = parser.parse_args()
 
-experiment_list = [
-    "EXP005",
-    "EXP006",
-    "EXP002",
-    "EXP003",
-    "EXP008",
-    "EXP009",
-    "EXP012",
-    "EXP011",
-]
+    # Get the path to the data
+    config = config_file.load_config("./info_files/dir_data.csv")
 
+    data_folder = Path(config["dir_extendend_data"])
+    output_folder = Path(config["output_dir"])
+    os.makedirs(output_folder / "compositional_shift", exist_ok=True)
 
-# Load compound info
-c_info = comp_info.information("./info_files")
+    # Load the experiments in the catalog
+    store = experiment_store.experiment_store(
+        "./info_files/list_exp.csv", data_folder, workers=args.workers or None
+    )
 
-compound_colours = comp_info.load_colours_dict("./info_files/compound_information.csv")
+    # The sets of experiments which will be used in the analysis. The perturbed
+    # experiments of each set, ordered by the amplitude and rate of the Ca(OH)2
+    # perturbation, are compared with the steady state experiment of the set.
+    set_names = ["20_mM_amp", "50_mM_amp", "100_mM_amp", "50_mM_freq"]
+    pairs = store.reference_pairs(
+        {"std_Ca(OH)2": 0},
+        group="set",
+        groups=set_names,
+        order_by=["std_Ca(OH)2", "rate_Ca(OH)2"],
+    )
 
-dic_diff = dict()
-for x in c_info.ind:
-    dic_diff[x] = []
+    references = list(dict.fromkeys(r for r, _ in pairs))
+    experiment_list = [p for _, p in pairs]
 
-compound_numbering = list(zip(c_info.ind, c_info.SMILES))
+    # Load compound info
+    c_info = comp_info.information("./info_files")
 
-for c, set in enumerate(experiment_sets, 0):
-    current_set = []  # store for the data in each series
-    for exp in set:
+    compound_colours = comp_info.load_colours_dict(
+        "./info_files/compound_information.csv"
+    )
 
-        # Load data
-        working_path = data_folder / exp / "Analysed_data"
+    # calculate relative difference of all perturbed states from all steady states
+    traces, present = store.compound_traces(c_info.SMILES, references + experiment_list)
+    shifts = data_analysis_functions.relative_shifts(
+        traces,
+        present,
+        range(len(references)),
+        range(len(references), len(references) + len(experiment_list)),
+    )
 
-        file_name = working_path / f"{exp}_Data.csv"
+    # keep the difference of each perturbed state from the steady state of its set
+    pair_shifts = [shifts[references.index(r), p] for p, (r, _) in enumerate(pairs)]
 
-        data = data_report.data_report(file=file_name)
+    # normalize relative difference from steady state for each compound, between -1 and 1, inf values are replaced with 1
+    rel_diff = data_analysis_functions.normalized_shifts(pair_shifts, axis=0)
+    dic_rel_diff = dict(zip(c_info.ind, rel_diff.T))
 
-        current_set.append(data)
+    file_writers.write_rel_diff_csv(
+        dic_rel_diff,
+        experiment_list,
+        filename=output_folder
+        / "compositional_shift"
+        / f"relative_concentration_differences.csv",
+    )
 
-    # calculate relative difference perturbed state from steady state
-    dic_diff = data_analysis_functions.difference_average(
-        current_set[0], current_set[1], compound_numbering, dic_diff
+    # bootstrap confidence intervals of the (not normalized) relative differences,
+    # resampling blocks of timepoints of the autocorrelated traces
+    experiment_pairs = [
+        (references.index(r), len(references) + p) for p, (r, _) in enumerate(pairs)
+    ]
+    lower, upper = resampling.shift_confidence_intervals(
+        traces,
+        present,
+        experiment_pairs,
+        n_resamples=10000,
+        block_size=None,
+        workers=args.workers or None,
     )
-    dic_diff = data_analysis_functions.difference_average(
-        current_set[0], current_set[2], compound_numbering, dic_diff
+
+    file_writers.write_rel_diff_ci_csv(
+        lower,
+        upper,
+        c_info.ind,
+        experiment_list,
+        filename=output_folder
+        / "compositional_shift"
+        / f"relative_concentration_difference_intervals.csv",
     )
 
-# normalize relative difference from steady state for each compound, between -1 and 1, inf values are replaced with 1
-dic_rel_diff = data_analysis_functions.normalized_difference(
-    dic_diff, compound_numbering
-)
 
-file_writers.write_rel_diff_csv(
-    dic_rel_diff,
-    experiment_list,
-    filename=output_folder
-    / "compositional_shift"
-    / f"relative_concentration_differences.csv",
-)
+if __name__ == "__main__":
+    main()
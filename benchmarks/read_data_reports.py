@@ -0,0 +1,51 @@
+"""
+Benchmark of parsing the data reports of all experiments in the extended
+data folder, e.g. Extended_data_GH/*/Analysed_data/*_Data.csv.
+
+The .csv files are parsed with data_report.data_report, without the binary
+cache. Run from the parent directory of the scripts:
+
+    python -m benchmarks.read_data_reports
+
+and again after checking out an earlier commit to compare the timings.
+"""
+
+import time
+import argparse
+from pathlib import Path
+
+from processing_scripts_formose import config_file, data_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="number of timed runs, the fastest one is reported",
+    )
+    args = parser.parse_args()
+
+    # Get the path to the data
+    config = config_file.load_config("./info_files/dir_data.csv")
+    data_folder = Path(config["dir_extendend_data"])
+
+    files = sorted(data_folder.glob("*/Analysed_data/*_Data.csv"))
+    size = sum(f.stat().st_size for f in files)
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for file in files:
+            data_report.data_report(file=file)
+        best = min(best, time.perf_counter() - start)
+
+    print(
+        f"Loading {len(files)} data reports ({size / 1e6:.0f} MB), "
+        f"best of {args.repeat}: {1000 * best:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+"""
+Hierarchical clustering of the compound traces of experiments.
+
+Correlation distances are calculated as a matrix product of the
+standardized traces, in chunks of rows so large compound panels fit in
+memory. The condensed distance matrices are cached next to the binary cache
+of the data reports (see data_cache), keyed by the content hash of the data
+report and the distance parameters.
+
+The stability of the clusters is estimated with a multiscale (block)
+bootstrap of the timepoints, as in pvclust (Suzuki and Shimodaira), which
+gives approximately unbiased (AU) and bootstrap probability (BP) support
+values per node of the dendrogram.
+"""
+
+import os
+import numpy as np
+from pathlib import Path
+from scipy import stats
+from scipy.spatial.distance import pdist
+from scipy.cluster.hierarchy import linkage
+
+from processing_scripts_formose import data_cache, parallel, resampling
+from processing_scripts_formose.data_analysis_functions import normalized_deviations
+
+# ratios of the resampled to the original number of timepoints (pvclust)
+BOOTSTRAP_SCALES = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4]
+
+
+def correlation_distances(traces, dtype=np.float64, chunk_size=1024):
+    """
+    Calculate the correlation distances (1 - Pearson r) between all pairs of
+    rows, as scipy.spatial.distance.pdist(traces, "correlation").
+
+    Parameters
+    ----------
+    traces: numpy array
+        Compound x time array.
+    dtype: numpy dtype
+        Precision of the calculation, e.g. np.float32 for large panels.
+    chunk_size: int
+        Number of rows multiplied with the remaining rows at once.
+
+    Returns
+    -------
+    distances: numpy array
+        Condensed distance matrix (see scipy.spatial.distance.squareform).
+    """
+
+    standardized = normalized_deviations(np.asarray(traces, dtype=dtype)).astype(dtype)
+    n = len(standardized)
+
+    distances = np.empty(n * (n - 1) // 2, dtype=dtype)
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        block = 1 - standardized[start:end] @ standardized[start:].T
+
+        for row in range(start, end):
+            # condensed index of the pair (row, row + 1)
+            first = n * row - row * (row + 1) // 2
+            distances[first : first + n - row - 1] = block[
+                row - start, row - start + 1 :
+            ]
+
+    return distances
+
+
+def distance_cache_file(file, metric="correlation", dtype=np.float64):
+    """
+    Get the path of the cached distance matrix of a data report file, for
+    the current state of the file.
+
+    Parameters
+    ----------
+    file: pathlib Path or str
+        Path to the data report .csv file.
+    metric: str
+    dtype: numpy dtype
+
+    Returns
+    -------
+    path: pathlib Path or None
+        None if the data report has no current binary cache.
+    """
+
+    index = data_cache.read_index(file)
+    if not data_cache.is_current(file, index=index):
+        return None
+
+    digest = index["source"]["sha256"][:16]
+    name = f"distances_{metric}_{np.dtype(dtype).name}"
+
+    return data_cache.cache_path(file) / f"{name}_{digest}.npy"
+
+
+def report_distances(report, file=None, metric="correlation", dtype=np.float64):
+    """
+    Calculate the distance matrix of the traces in a data report, using the
+    cached matrix of its source file if there is one.
+
+    Parameters
+    ----------
+    report: data_report.data_report
+    file: pathlib Path, str or None
+        Path to the data report .csv file. Not cached if None.
+    metric: str
+        "correlation", or any other metric of scipy.spatial.distance.pdist.
+    dtype: numpy dtype
+        Precision of the correlation distances.
+
+    Returns
+    -------
+    distances: numpy array
+        Condensed distance matrix.
+    """
+
+    cache_file = None
+    if file is not None:
+        cache_file = distance_cache_file(file, metric=metric, dtype=dtype)
+
+    if cache_file is not None and cache_file.exists():
+        return np.load(cache_file)
+
+    if metric == "correlation":
+        distances = correlation_distances(report.to_numpy(), dtype=dtype)
+    else:
+        distances = pdist(report.to_numpy(), metric)
+
+    if cache_file is not None:
+        # remove the distances of earlier versions of the data report
+        for old in cache_file.parent.glob(f"{cache_file.stem.rsplit('_', 1)[0]}_*.npy"):
+            os.remove(old)
+        temp_file = cache_file.with_suffix(f".tmp{os.getpid()}.npy")
+        np.save(temp_file, distances)
+        os.replace(temp_file, cache_file)
+
+    return distances
+
+
+def cluster_report(job):
+    """
+    Cluster the traces of a data report file.
+
+    Used by the worker processes of cluster_experiments.
+
+    Parameters
+    ----------
+    job: tuple
+        Path to the data report .csv file, metric, linkage method, dtype and
+        use_cache (see cluster_experiments).
+
+    Returns
+    -------
+    names: list[str]
+        Entry names of the traces, in the order of the leaves in Z.
+    Z: numpy array
+        Linkage matrix (see scipy.cluster.hierarchy.linkage).
+    """
+
+    file, metric, method, dtype, use_cache = job
+
+    report = data_cache.load_data_report(file, use_cache=use_cache)
+    distances = report_distances(
+        report, file=file if use_cache else None, metric=metric, dtype=dtype
+    )
+
+    Z = linkage(distances, method, metric, optimal_ordering=False)
+
+    return [*report.data], Z
+
+
+def cluster_experiments(
+    files,
+    metric="correlation",
+    method="average",
+    dtype=np.float64,
+    use_cache=True,
+    workers=1,
+):
+    """
+    Cluster the traces of several data reports, in parallel.
+
+    Parameters
+    ----------
+    files: list[pathlib Path or str]
+        Paths to the data report .csv files.
+    metric: str
+        Distance metric, see report_distances.
+    method: str
+        Linkage method, see scipy.cluster.hierarchy.linkage.
+    dtype: numpy dtype
+        Precision of the correlation distances.
+    use_cache: bool
+        Load the data reports and distance matrices through the cache.
+    workers: int or None
+        Number of worker processes, 1 runs in this process. None uses
+        all available cores.
+
+    Returns
+    -------
+    clusters: list[tuple(list[str], numpy array)]
+        Entry names and linkage matrix per file (see cluster_report).
+    """
+
+    jobs = [(Path(f), metric, method, dtype, use_cache) for f in files]
+
+    return parallel.map_jobs(cluster_report, jobs, workers)
+
+
+def cluster_members(Z):
+    """
+    Get the leaves below each node of a linkage matrix.
+
+    Parameters
+    ----------
+    Z: numpy array
+        Linkage matrix (see scipy.cluster.hierarchy.linkage).
+
+    Returns
+    -------
+    members: list[int]
+        Per row of Z, the leaves of the node as a bit mask (bit i for leaf i).
+    """
+
+    n = len(Z) + 1
+    members = [1 << i for i in range(n)]
+    for a, b in np.asarray(Z[:, :2], dtype=int):
+        members.append(members[a] | members[b])
+
+    return members[n:]
+
+
+def weighted_correlation_distances(traces, weights, chunk_size=50):
+    """
+    Calculate the correlation distances between the rows of traces for
+    several weightings of the timepoints, e.g. the number of times each
+    timepoint is drawn in bootstrap resamples.
+
+    Parameters
+    ----------
+    traces: numpy array
+        Compound x time array.
+    weights: numpy array
+        Resample x time array.
+    chunk_size: int
+        Number of resamples calculated at once, which bounds the size of the
+        resample x compound x time products.
+
+    Returns
+    -------
+    distances: numpy array
+        Resample x condensed distance matrix array. Undefined distances of
+        traces that are constant in a resample are 1 (uncorrelated).
+    """
+
+    # standardized first, which leaves the correlations unchanged and avoids
+    # cancellation in the covariances
+    values = normalized_deviations(np.asarray(traces, dtype=float))
+    weights = np.asarray(weights, dtype=float)
+    weights = weights / weights.sum(axis=1, keepdims=True)
+
+    rows, columns = np.triu_indices(len(values), k=1)
+    distances = np.empty((len(weights), len(rows)))
+
+    for start in range(0, len(weights), chunk_size):
+        w = weights[start : start + chunk_size]
+
+        means = w @ values.T
+        covariances = (values * w[:, np.newaxis, :]) @ values.T
+        covariances -= means[:, :, np.newaxis] * means[:, np.newaxis, :]
+
+        variances = np.einsum("rii->ri", covariances)
+        # variances at the level of rounding errors are constant traces
+        constant = variances <= 1e-12 * variances.max(axis=1, keepdims=True)
+        std = np.sqrt(np.where(constant, np.nan, variances))
+        with np.errstate(invalid="ignore"):
+            correlations = covariances / (std[:, :, np.newaxis] * std[:, np.newaxis, :])
+
+        distances[start : start + len(w)] = np.nan_to_num(
+            1 - correlations[:, rows, columns], nan=1.0
+        )
+
+    return distances
+
+
+def bootstrap_support(job):
+    """
+    Count how often each cluster of a dendrogram is found in the dendrograms
+    of block bootstrap resamples of the timepoints.
+
+    Used by the worker processes of multiscale_bootstrap.
+
+    Parameters
+    ----------
+    job: tuple
+        Cluster bit masks (see cluster_members), linkage method, resample
+        length, block size, number of resamples and numpy SeedSequence. The
+        compound x time array is the shared value "traces" of the jobs.
+
+    Returns
+    -------
+    counts: numpy array
+        One count per cluster.
+    """
+
+    clusters, method, length, block_size, n_resamples, seed = job
+    traces = parallel.shared_value("traces")
+    rng = np.random.default_rng(seed)
+    n_points = traces.shape[1]
+
+    indices = resampling.surrogate_indices(
+        n_points,
+        n_resamples,
+        rng,
+        method="block_bootstrap",
+        block_size=block_size,
+        length=length,
+    )
+    rows = np.repeat(np.arange(n_resamples), length)
+    weights = np.bincount(
+        rows * n_points + indices.ravel(), minlength=n_resamples * n_points
+    ).reshape(n_resamples, n_points)
+
+    positions = {c: k for k, c in enumerate(clusters)}
+    counts = np.zeros(len(clusters), dtype=int)
+    for distances in weighted_correlation_distances(traces, weights):
+        for c in cluster_members(linkage(distances, method)):
+            k = positions.get(c)
+            if k is not None:
+                counts[k] += 1
+
+    return counts
+
+
+def multiscale_fit(frequencies, scales, n_resamples):
+    """
+    Fit the bootstrap probabilities of clusters at several scales to the
+    model of Shimodaira, -Phi^-1(BP(r)) = v sqrt(r) + c / sqrt(r), by weighted
+    least squares, as in pvclust.
+
+    Parameters
+    ----------
+    frequencies: numpy array
+        Scale x cluster array of the fractions of resamples containing the
+        clusters.
+    scales: list[float]
+        Ratios of the resampled to the original number of timepoints.
+    n_resamples: int
+        Number of resamples per scale.
+
+    Returns
+    -------
+    au, bp: numpy arrays
+        Approximately unbiased p-values, 1 - Phi(v - c), and bootstrap
+        probabilities, 1 - Phi(v + c), per cluster. Clusters found in all or
+        none of the resamples at all but one scale get 1 or 0.
+    """
+
+    frequencies = np.asarray(frequencies, dtype=float)
+    r = np.asarray(scales, dtype=float)
+    design = np.column_stack([np.sqrt(r), 1 / np.sqrt(r)])
+
+    au = np.empty(frequencies.shape[1])
+    bp = np.empty(frequencies.shape[1])
+    for k, f in enumerate(frequencies.T):
+        use = (f > 0) & (f < 1)
+        if use.sum() < 2:
+            au[k] = bp[k] = 0.0 if f.mean() < 0.5 else 1.0
+            continue
+
+        z = stats.norm.isf(f[use])
+        # inverse variances of z, by the delta method
+        weights = np.sqrt(
+            n_resamples * stats.norm.pdf(z) ** 2 / (f[use] * (1 - f[use]))
+        )
+        (v, c), *_ = np.linalg.lstsq(
+            design[use] * weights[:, np.newaxis], z * weights, rcond=None
+        )
+
+        au[k] = stats.norm.sf(v - c)
+        bp[k] = stats.norm.sf(v + c)
+
+    return au, bp
+
+
+def multiscale_bootstrap(
+    traces,
+    Z,
+    method="average",
+    scales=BOOTSTRAP_SCALES,
+    n_resamples=1000,
+    block_size=None,
+    seed=0,
+    workers=1,
+):
+    """
+    Find the support of the clusters of a dendrogram of correlation distances
+    with a multiscale block bootstrap of the timepoints (pvclust).
+
+    At each scale r, resamples of round(r * n) timepoints are drawn in blocks
+    of consecutive timepoints, which keeps the autocorrelation of the traces,
+    and clustered again. The resamples are drawn in chunks from independent
+    random streams spawned from seed, so the results do not depend on the
+    number of workers.
+
+    Parameters
+    ----------
+    traces: numpy array
+        Compound x time array that was clustered.
+    Z: numpy array
+        Linkage matrix of the correlation distances of traces.
+    method: str
+        Linkage method used for Z.
+    scales: list[float]
+        Ratios of the resampled to the original number of timepoints.
+    n_resamples: int
+        Number of resamples per scale.
+    block_size: int or None
+        Block size in timepoints. The cube root of the number of timepoints
+        if None.
+    seed: int or None
+    workers: int or None
+        Number of worker processes, 1 runs in this process. None uses
+        all available cores.
+
+    Returns
+    -------
+    support: dict
+        "scales": ratios of the resampled to the original number of timepoints
+        "frequencies": scale x node array of the fractions of resamples
+        containing the cluster of each row of Z
+        "au", "bp": approximately unbiased p-values and bootstrap
+        probabilities per row of Z (see multiscale_fit)
+    """
+
+    traces = np.asarray(traces, dtype=float)
+    n_points = traces.shape[1]
+    if block_size is None:
+        block_size = resampling.default_block_size(n_points)
+
+    clusters = cluster_members(Z)
+    lengths = [max(2, int(round(r * n_points))) for r in scales]
+
+    n_chunks = -(-n_resamples // resampling.CHUNK_SIZE)
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(lengths) * n_chunks))
+
+    jobs = []
+    for length in lengths:
+        for c in range(n_chunks):
+            n = min(resampling.CHUNK_SIZE, n_resamples - c * resampling.CHUNK_SIZE)
+            jobs.append((clusters, method, length, block_size, n, next(seeds)))
+
+    # the traces are sent to each worker once, not with every job
+    counts = parallel.map_jobs(
+        bootstrap_support, jobs, workers, shared={"traces": traces}
+    )
+    counts = np.reshape(counts, (len(lengths), n_chunks, len(clusters))).sum(axis=1)
+
+    scales = np.array(lengths) / n_points
+    frequencies = counts / n_resamples
+    au, bp = multiscale_fit(frequencies, scales, n_resamples)
+
+    return {"scales": scales, "frequencies": frequencies, "au": au, "bp": bp}
@@ -30,19 +30,41 @@ def load_config(filename):
     return config
 
 
+def load_catalog(filename):
+    """
+    Load the experiment catalog (e.g. info_files/list_exp.csv).
+
+    Parameters
+    ----------
+    filename: str or pathlib.Path
+        Path to the catalog file.
+
+    Returns
+    -------
+    header: list[str]
+        Column names.
+    rows: list[list[str]]
+        One row per experiment, experiment code first.
+    """
+
+    with open(filename, "r") as file:
+        text = file.read()
+
+    lines = [x.split(",") for x in text.split("\n") if x != ""]
+
+    return lines[0], lines[1:]
+
+
 def load_exp_info(paths_folder, experiments):
-    with open(paths_folder, "r") as f:
-        exp = []
-        for line in f:
-            line = list(line.strip("\n").split(","))
-            if line[0] in experiments:
-                exp.append(line)
-        list_exp = {}
-        condition = []
-        for x in exp:
+    _, rows = load_catalog(paths_folder)
+
+    list_exp = {}
+    condition = []
+    for x in rows:
+        if x[0] in experiments:
             name = x[4]
             name = name.replace("stdev", "\u03C3")
-            list_exp[x[0]] = []
-            list_exp[x[0]] += [x[1], x[2], x[3], name, x[5]]
+            list_exp[x[0]] = [x[1], x[2], x[3], name, x[5]]
             condition.append(x[0])
-        return list_exp, condition
+
+    return list_exp, condition
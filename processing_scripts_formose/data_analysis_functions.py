@@ -1,8 +1,102 @@
+import warnings
 import numpy as np
-from scipy import stats
+import pandas as pd
+from scipy import signal, special, stats
 import matplotlib as mpl
 import matplotlib.colors as mcolors
 
+from processing_scripts_formose.data_report import compound_index, trace_matrix
+
+# colour scale of the correlation values: the correlation range is quantized
+# to 360 steps, the last entry is the colour of the largest value
+CORRELATION_CMAP = mpl.colors.LinearSegmentedColormap.from_list(
+    "",
+    ["midnightblue", "#0000D6", "lightskyblue", "white", "pink", "red", "maroon"],
+    N=360,
+)
+CORRELATION_COLOURS = np.array(
+    [mcolors.rgb2hex(c) for c in CORRELATION_CMAP(np.arange(361))]
+)
+
+
+def trace_statistics(traces, quantiles=(0.25, 0.5, 0.75), statistics=None):
+    """
+    Calculate descriptive statistics of every compound trace in one
+    vectorized reduction along the time axis.
+
+    Missing values (nan) are left out of the statistics. Only the requested
+    statistics are calculated.
+
+    Parameters
+    ----------
+    traces: data_report.data_report, data_report.trace_matrix or numpy array
+        Traces along the last axis, e.g. a compound x time array or the
+        experiment x compound x time array of an experiment_store.
+    quantiles: tuple of float
+        Quantiles to calculate, between 0 and 1.
+    statistics: iterable of str or None
+        Statistics to calculate, from "mean", "std", "median", "min", "max"
+        and "quantiles". All of them if None.
+
+    Returns
+    -------
+    results: dict
+        "compounds": entry names of the rows (None for numpy array input)
+        "count": number of non-missing values
+        "mean", "std" (ddof=1), "median", "min", "max": arrays with the shape
+        of traces without the time axis
+        "quantiles": array with an extra last axis, one entry per quantile
+    """
+
+    # plain and nan-skipping reductions along the time axis
+    reductions = {
+        "mean": (np.mean, np.nanmean, {}),
+        "std": (np.std, np.nanstd, {"ddof": 1}),
+        "median": (np.median, np.nanmedian, {}),
+        "min": (np.min, np.nanmin, {}),
+        "max": (np.max, np.nanmax, {}),
+        "quantiles": (np.quantile, np.nanquantile, {"q": quantiles}),
+    }
+
+    statistics = [*reductions] if statistics is None else [*statistics]
+    for name in statistics:
+        if name not in reductions:
+            raise ValueError(f"Unknown statistic: {name}")
+
+    compounds = None
+    if hasattr(traces, "data"):
+        traces = traces.data
+    if isinstance(traces, trace_matrix):
+        compounds = [*traces]
+        traces = traces.array
+
+    traces = np.asarray(traces, dtype=float)
+    missing = np.isnan(traces)
+
+    results = {"compounds": compounds}
+    results["count"] = traces.shape[-1] - missing.sum(axis=-1)
+
+    if traces.shape[-1] == 0:
+        # traces without values give nan statistics
+        traces = np.full(traces.shape[:-1] + (1,), np.nan)
+        missing = np.ones(traces.shape, dtype=bool)
+
+    # the nan-functions are only used when needed, they are slower
+    nan_skipping = missing.any()
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for name in reductions:
+            if name in statistics:
+                function, nan_function, kwargs = reductions[name]
+                if nan_skipping:
+                    function = nan_function
+                results[name] = function(traces, axis=-1, **kwargs)
+
+    if "quantiles" in results:
+        results["quantiles"] = np.moveaxis(results["quantiles"], 0, -1)
+
+    return results
+
 
 def data_averages(data_report):
     """
@@ -17,12 +111,9 @@ def data_averages(data_report):
     averages: dict()
     """
 
-    averages = dict()
+    statistics = trace_statistics(data_report.data, statistics=["mean"])
 
-    for compound in data_report.data:
-        averages[compound] = np.average(data_report.data[compound])
-
-    return averages
+    return dict(zip(statistics["compounds"], statistics["mean"]))
 
 
 def data_standard_deviations(data_report):
@@ -37,12 +128,357 @@ def data_standard_deviations(data_report):
     st_devs: dict()
     """
 
-    st_devs = dict()
+    statistics = trace_statistics(data_report.data, statistics=["std"])
+
+    return dict(zip(statistics["compounds"], statistics["std"]))
+
+
+def compound_samples(data_reports, list_comp):
+    """
+    Align the compound traces of data reports into samples for the
+    significance tests.
+
+    If a compound is not present in a data report, its series is defined to
+    be a single zero. The data reports must not contain repeated compound
+    entries (see data_report.clean_data_reports).
+
+    Parameters
+    ----------
+    data_reports: list[data_report.data_report]
+    list_comp: list
+        (index, compound) tuples, the compounds of the rows of the samples.
+
+    Returns
+    -------
+    samples: list[numpy array]
+        One compound x time array per data report, padded with nan.
+    keys: list[list[str]]
+        Per data report, the entry name of each compound or "no_comp".
+    """
+
+    samples = []
+    keys = []
+    for report in data_reports:
+        compounds = compound_index(report.data)
+        entries = [compounds.get(compound, "no_comp") for _, compound in list_comp]
+
+        sample = np.full((len(list_comp), max(len(report.series_values), 1)), np.nan)
+        for row, entry in enumerate(entries):
+            if entry in report.data:
+                sample[row, : len(report.data[entry])] = report.data[entry]
+            else:
+                sample[row, 0] = 0.0
+
+        samples.append(sample)
+        keys.append(entries)
+
+    return samples, keys
+
+
+def sample_moments(samples):
+    """
+    Calculate the size, mean and variance (ddof=1) of every row of a set of
+    samples, leaving out missing values (nan).
+
+    Parameters
+    ----------
+    samples: list[numpy array] or numpy array
+        Compound x time arrays, or an experiment x compound x time array.
+
+    Returns
+    -------
+    count, mean, variance: numpy arrays
+        Sample x compound arrays.
+    """
+
+    shape = (len(samples), len(samples[0]) if len(samples) > 0 else 0)
+    count = np.zeros(shape)
+    mean = np.full(shape, np.nan)
+    variance = np.full(shape, np.nan)
+
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for s, sample in enumerate(samples):
+            sample = np.asarray(sample, dtype=float)
+            missing = np.isnan(sample)
+            count[s] = sample.shape[-1] - missing.sum(axis=-1)
+
+            # the nan-functions are only used for rows with missing values
+            full = ~missing.any(axis=-1)
+            for rows, average in ((full, np.mean), (~full, np.nanmean)):
+                if rows.any():
+                    m = average(sample[rows], axis=-1, keepdims=True)
+                    mean[s, rows] = m[:, 0]
+                    variance[s, rows] = average((sample[rows] - m) ** 2, axis=-1)
+
+        variance *= count / (count - 1)
+
+    return count, mean, variance
+
+
+def t_tests(moments, pairs, equal_var=True):
+    """
+    Two-sided independent t-tests between pairs of samples, for all compounds
+    at once.
+
+    Parameters
+    ----------
+    moments: tuple of numpy arrays
+        Count, mean and variance of the samples (see sample_moments).
+    pairs: numpy array
+        Pair x 2 array with the indices of the samples to compare.
+    equal_var: bool
+        True for Student's t-test, False for Welch's t-test.
+
+    Returns
+    -------
+    statistic, p_values: numpy arrays
+        Pair x compound arrays.
+    """
+
+    count, mean, variance = moments
+    n1, n2 = count[pairs[:, 0]], count[pairs[:, 1]]
+    v1, v2 = variance[pairs[:, 0]], variance[pairs[:, 1]]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if equal_var:
+            # a single value adds nothing to the pooled variance
+            v1 = np.where(n1 == 1, 0.0, v1)
+            v2 = np.where(n2 == 1, 0.0, v2)
+            df = n1 + n2 - 2.0
+            pooled = ((n1 - 1) * v1 + (n2 - 1) * v2) / df
+            denominator = np.sqrt(pooled * (1.0 / n1 + 1.0 / n2))
+        else:
+            vn1 = v1 / n1
+            vn2 = v2 / n2
+            df = (vn1 + vn2) ** 2 / (vn1**2 / (n1 - 1) + vn2**2 / (n2 - 1))
+            df = np.where(np.isnan(df), 1.0, df)
+            denominator = np.sqrt(vn1 + vn2)
+
+        statistic = (mean[pairs[:, 0]] - mean[pairs[:, 1]]) / denominator
+
+    p_values = 2 * special.stdtr(df, -np.abs(statistic))
+
+    return statistic, p_values
+
+
+def mann_whitney_tests(samples, pairs):
+    """
+    Two-sided Mann-Whitney U tests between pairs of samples, for all
+    compounds at once.
+
+    Parameters
+    ----------
+    samples: list[numpy array] or numpy array
+        Compound x time arrays, or an experiment x compound x time array.
+    pairs: numpy array
+        Pair x 2 array with the indices of the samples to compare.
+
+    Returns
+    -------
+    statistic, p_values: numpy arrays
+        Pair x compound arrays.
+    """
+
+    shape = (len(pairs), len(samples[0]) if len(samples) > 0 else 0)
+    statistic = np.full(shape, np.nan)
+    p_values = np.full(shape, np.nan)
+
+    # remove the padding at the end of the samples, so only rows with
+    # missing values need the (slow) nan_policy="omit"
+    trimmed = []
+    for sample in samples:
+        sample = np.asarray(sample, dtype=float)
+        filled = np.nonzero(~np.isnan(sample).all(axis=0))[0]
+        trimmed.append(sample[:, : filled[-1] + 1 if len(filled) > 0 else 0])
+
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for p, (i, j) in enumerate(pairs):
+            x, y = trimmed[i], trimmed[j]
+            if x.shape[-1] == 0 or y.shape[-1] == 0:
+                continue
+
+            full = ~(np.isnan(x).any(axis=-1) | np.isnan(y).any(axis=-1))
+            for rows, nan_policy in ((full, "propagate"), (~full, "omit")):
+                if rows.any():
+                    result = stats.mannwhitneyu(
+                        x[rows], y[rows], axis=-1, nan_policy=nan_policy
+                    )
+                    statistic[p, rows] = result.statistic
+                    p_values[p, rows] = result.pvalue
+
+    return statistic, p_values
+
+
+def adjust_p_values(p_values, correction=None):
+    """
+    Correct p-values for multiple testing. All non-missing p-values are
+    treated as one family of tests.
+
+    Parameters
+    ----------
+    p_values: numpy array
+    correction: str or None
+        "bonferroni", "fdr_bh" (Benjamini-Hochberg) or None.
+
+    Returns
+    -------
+    adjusted: numpy array
+        With the shape of p_values, nan where p_values is nan.
+    """
+
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = p_values.copy()
+    if correction is None:
+        return adjusted
+
+    valid = ~np.isnan(p_values)
+    values = p_values[valid]
+    m = len(values)
+
+    if correction == "bonferroni":
+        values = values * m
+    elif correction == "fdr_bh":
+        order = np.argsort(values)
+        ranked = values[order] * m / np.arange(1, m + 1)
+        ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+        values = np.empty(m)
+        values[order] = ranked
+    else:
+        raise ValueError(f"Unknown multiple testing correction: {correction}")
+
+    adjusted[valid] = np.minimum(values, 1.0)
+
+    return adjusted
+
+
+def pairwise_p_values(samples, pairs, test="student"):
+    """
+    Calculate the test statistics and p-values between pairs of samples for
+    all compounds.
+
+    Parameters
+    ----------
+    samples: list[numpy array] or numpy array
+        Compound x time arrays, or an experiment x compound x time array.
+    pairs: list of tuples
+        Indices of the samples to compare.
+    test: str
+        "student", "welch" or "mannwhitney".
+
+    Returns
+    -------
+    statistic, p_values: numpy arrays
+        Pair x compound arrays.
+    """
+
+    pairs = np.asarray(pairs, dtype=int).reshape(-1, 2)
 
-    for compound in data_report.data:
-        st_devs[compound] = np.std(data_report.data[compound], ddof=1)
+    if test == "student":
+        return t_tests(sample_moments(samples), pairs, equal_var=True)
+    elif test == "welch":
+        return t_tests(sample_moments(samples), pairs, equal_var=False)
+    elif test == "mannwhitney":
+        return mann_whitney_tests(samples, pairs)
 
-    return st_devs
+    raise ValueError(f"Unknown significance test: {test}")
+
+
+def pairwise_tests(
+    samples, pairs=None, test="student", correction=None, compounds=None, names=None
+):
+    """
+    Test every compound for significant differences between pairs of
+    samples, e.g. all experiments in an experiment_store:
+
+        pairwise_tests(store.traces, names=store.codes, compounds=store.compounds)
+
+    Parameters
+    ----------
+    samples: list[numpy array] or numpy array
+        Compound x time arrays with the same compound rows, or an experiment
+        x compound x time array. Missing values (nan) are left out.
+    pairs: list of tuples or None
+        Indices of the samples to compare. All pairs if None.
+    test: str
+        "student", "welch" or "mannwhitney".
+    correction: str or None
+        Multiple testing correction (see adjust_p_values).
+    compounds: list or None
+        Names of the compound rows. Row numbers if None.
+    names: list or None
+        Names of the samples. Sample indices if None.
+
+    Returns
+    -------
+    table: pandas DataFrame
+        One row per pair and compound with the columns sample_1, sample_2,
+        compound, statistic, p_value and p_adjusted.
+    """
+
+    if pairs is None:
+        pairs = [
+            (i, j) for i in range(len(samples)) for j in range(i + 1, len(samples))
+        ]
+    pairs = np.asarray(pairs, dtype=int).reshape(-1, 2)
+
+    statistic, p_values = pairwise_p_values(samples, pairs, test=test)
+    n_compounds = statistic.shape[1]
+
+    if compounds is None:
+        compounds = np.arange(n_compounds)
+    if names is None:
+        names = np.arange(len(samples))
+    names = np.asarray(names, dtype=object)
+
+    table = pd.DataFrame(
+        {
+            "sample_1": np.repeat(names[pairs[:, 0]], n_compounds),
+            "sample_2": np.repeat(names[pairs[:, 1]], n_compounds),
+            "compound": np.tile(np.asarray(compounds, dtype=object), len(pairs)),
+            "statistic": statistic.ravel(),
+            "p_value": p_values.ravel(),
+            "p_adjusted": adjust_p_values(p_values, correction).ravel(),
+        }
+    )
+
+    return table
+
+
+def series_p_values(data_reports, pairs, list_comp, test="student", correction=None):
+    """
+    Calculate the p-values for the compound traces between pairs of data
+    reports in a series, in one pass.
+
+    Parameters
+    ----------
+    data_reports: list[data_report.data_report]
+    pairs: list of tuples
+        Indices of the data reports to compare.
+    list_comp: list
+    test: str
+        "student", "welch" or "mannwhitney".
+    correction: str or None
+        Multiple testing correction over all pairs and compounds (see
+        adjust_p_values).
+
+    Returns
+    -------
+    p_values: list[dict()]
+        Per pair, the p-values keyed by the entry names of the compounds in
+        the second data report ("no_comp" if absent), see data_p_values.
+    """
+
+    samples, keys = compound_samples(data_reports, list_comp)
+    _, p_values = pairwise_p_values(samples, pairs, test=test)
+    p_values = adjust_p_values(p_values, correction)
+
+    series = []
+    for (_, j), p in zip(pairs, p_values):
+        series.append(dict(zip(keys[j], p)))
+
+    return series
 
 
 def data_p_values(data_report_1, data_report_2, list_comp):
@@ -58,49 +494,100 @@ def data_p_values(data_report_1, data_report_2, list_comp):
     -------
     ttest: dict()
     """
-    p_values = dict()
 
-    steady_state_comp = [*data_report_1.data]
-    perturbed_state_comp = [*data_report_2.data]
+    return series_p_values([data_report_1, data_report_2], [(0, 1)], list_comp)[0]
 
-    steady_state = data_report_1.data
-    perturbed_state = data_report_2.data
 
-    dist_1 = []
-    dist_2 = []
+def window_starts(n_points, interval):
+    """
+    Find the windows of a rolling mean over the preceding interval samples.
 
-    # if a compound is not present in a data report, its series is defined to
-    # be a sequence of zeros
-    for _, compound in list_comp:
-        token = "no_comp"
-        # find steady state concentration for compound, zero values are removed from list
-        for x in steady_state_comp:
-            if compound in x:
-                token = x
-        if token in steady_state_comp:
-            dist_1 = steady_state[token]
-        else:
-            dist_1 = [0]
-
-        # find perturbed state concentration for compound, zero values are removed from list
-        token = "no_comp"
-        for x in perturbed_state_comp:
-            if compound in x:
-                token = x
-        if token in perturbed_state_comp:
-            dist_2 = perturbed_state[token]
-        else:
-            dist_2 = [0]
+    Parameters
+    ----------
+    n_points: int
+        Number of samples.
+    interval: float
+        Window size in samples.
+
+    Returns
+    -------
+    ends, starts: numpy arrays
+        The window of sample a is [starts[a], ends[a]), for every sample with
+        a full preceding window.
+    """
+
+    ends = np.arange(n_points)
+    ends = ends[ends > interval - 1]
+    starts = np.trunc(ends - interval).astype(int)
+
+    return ends, starts
+
+
+def rolling_differentials(traces, t_interval, sample_time):
+    """
+    Find the variation of traces on the timescales t_interval: the
+    difference between the mean of each window of t_interval and the mean of
+    the window before it, normalized to zero mean and unit standard
+    deviation.
+
+    The window means of all traces are taken from a single cumulative sum,
+    so the cost does not depend on the window size.
+
+    Parameters
+    ----------
+    traces: numpy array
+        Compound x time array.
+    t_interval: 1D list
+        Time intervals, in the unit of sample_time.
+    sample_time: float
+        Time between samples.
+
+    Returns
+    -------
+    differentials: numpy array
+        Interval x compound x time array, padded with nan.
+    lengths: numpy array
+        Number of values in the differentials of each interval.
+    """
+
+    traces = np.atleast_2d(np.asarray(traces, dtype=float))
+    n_compounds, n_points = traces.shape
+
+    # the traces are centred to keep the cumulative sums small
+    centred = traces - traces.mean(axis=-1, keepdims=True)
+    sums = np.zeros((n_compounds, n_points + 1))
+    np.cumsum(centred, axis=-1, out=sums[:, 1:])
 
-        result = stats.ttest_ind(dist_1, dist_2, nan_policy="omit")
+    differentials = np.full((len(t_interval), n_compounds, n_points), np.nan)
+    lengths = np.zeros(len(t_interval), dtype=int)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for i, x in enumerate(t_interval):
+            interval = x / sample_time
 
-        p_values[token] = result.pvalue
-    return p_values
+            ends, starts = window_starts(n_points, interval)
+            lag = (sums[:, ends] - sums[:, starts]) / (ends - starts)
+
+            ends, starts = window_starts(lag.shape[1], interval)
+            d_lag = lag[:, ends] - lag[:, starts]
+            lengths[i] = d_lag.shape[1]
+            if lengths[i] == 0:
+                continue
+
+            zero_a = d_lag - d_lag.mean(axis=-1, keepdims=True)
+            differentials[i, :, : lengths[i]] = zero_a / zero_a.std(
+                axis=-1, keepdims=True
+            )
+
+    return differentials, lengths
 
 
 def differential_means(data, t_interval, sample_time, l):
     """
-    Find the variation in the signal on timescale t_interval.
+    Find the variation in the signal on timescale t_interval (see
+    rolling_differentials).
+
+    The data must not contain repeated compound entries (see
+    data_report.clean_data_reports).
 
     Parameters
     ----------
@@ -113,48 +600,209 @@ def differential_means(data, t_interval, sample_time, l):
     -------
     differentials: list of list of lists with respectively time intervals, compound differential and values in the differential
     """
-    compounds = [*data]
+    compounds = compound_index(data)
+
+    names = [compounds[y] for _, y in l if y in compounds]
+    if len(names) == 0:
+        return [[] for _ in t_interval]
+
+    traces = np.array([data[n] for n in names], dtype=float)
+    rolled, lengths = rolling_differentials(traces, t_interval, sample_time)
 
-    # def differential_means(val,t_interval,sample_time):
     differentials = []
-    for x in t_interval:
-        comb_lag = []
-        interval = x / sample_time
-        start = interval - 1
-
-        token = ""
-        for _, y in l:
-            condition = False
-            for key in compounds:
-                if y in key:
-                    token = key
-                    condition = True
-            if condition == True:
-                d = data[token]
-                lag = []
-                for a, z in enumerate(d):
-                    if a > start:
-                        sample_range = d[int(a - interval) : int(a)]
-                        lag.append(np.mean(sample_range))
-
-                d_lag = []
-                for a, z in enumerate(lag):
-                    if a > start:
-                        d_lag.append(z - lag[int(a - interval)])
-
-                m_lag = np.mean(d_lag)
-
-                zero_a = []
-                for x in d_lag:
-                    zero_a.append(x - m_lag)
-
-                norm_flow = zero_a / np.std(zero_a)
-
-                comb_lag.append(norm_flow)
-        differentials.append(comb_lag)
+    for values, n in zip(rolled, lengths):
+        differentials.append([v[:n] for v in values])
+
     return differentials
 
 
+def normalized_deviations(values):
+    """
+    Subtract the mean from the rows of an array and scale them to unit
+    length, so the dot product of two rows is their Pearson correlation.
+
+    Parameters
+    ----------
+    values: numpy array
+        Values along the last axis.
+
+    Returns
+    -------
+    normalized: numpy array
+    """
+
+    values = np.asarray(values, dtype=float)
+    values = values - values.mean(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values /= np.linalg.norm(values, axis=-1, keepdims=True)
+
+    return values
+
+
+def pearson_correlations(val, flow):
+    """
+    Find the Pearson correlation between the differentials of the compounds
+    and the input flow, for all compounds of a time interval in one matrix
+    product.
+
+    Parameters
+    ----------
+    val: list of compound x time arrays, or an interval x compound x time array
+        Compound differentials per time interval (see differential_means).
+    flow: list of list of lists with respectively time intervals, input flow differential and values in the differential
+
+    Returns
+    -------
+    correlations: numpy array
+        Interval x compound array.
+    """
+
+    correlations = []
+    for values, x in zip(val, flow):
+        y = normalized_deviations(x[0])
+        values = np.array(values, dtype=float).reshape(len(values), len(y))
+
+        correlations.append(np.clip(normalized_deviations(values) @ y, -1.0, 1.0))
+
+    return np.array(correlations)
+
+
+def residence_time_lag(data, sample_time):
+    """
+    Get the residence time of the reactor in samples, the default largest lag
+    of lagged_correlations.
+
+    Parameters
+    ----------
+    data: data_report.data_report
+    sample_time: float
+        Time between samples in s.
+
+    Returns
+    -------
+    lag: int
+    """
+
+    return int(round(data.conditions["Residence time/ s"] / sample_time))
+
+
+def lagged_correlations(val, flow, max_lag):
+    """
+    Find the Pearson correlation between the compound and flow differentials
+    (see correlation) at every lag from -max_lag to max_lag.
+
+    At lag k the compound differential at time t is paired with the flow
+    differential at time t - k, so positive lags are responses that follow
+    the flow. The correlation is calculated over the overlapping part of the
+    series: the cross products of all lags come from one FFT convolution and
+    the means and variances of the overlaps from cumulative sums, so each
+    interval takes O(T log T).
+
+    Parameters
+    ----------
+    val: list of list of lists with respectively time intervals, compound differential and values in the differential
+    flow: list of list of lists with respectively time intervals, input flow differential and values in the differential
+    max_lag: int
+        Largest lag in samples, e.g. residence_time_lag().
+
+    Returns
+    -------
+    lagged: dict
+        "lags": lags in samples
+        "correlations": interval x compound x lag array
+        "peak_lag": interval x compound array, the lag of the largest
+        absolute correlation
+        "peak_r": interval x compound array, the correlation at peak_lag
+    """
+
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    all_corr = []
+    for values, x in zip(val, flow):
+        y = np.asarray(x[0], dtype=float)
+        n_points = len(y)
+        values = np.array(values, dtype=float).reshape(len(values), n_points)
+
+        # centred series keep the sums of products small
+        values = values - values.mean(axis=-1, keepdims=True)
+        y = y - y.mean()
+
+        # full cross-correlation: entry k + n_points - 1 pairs values[t], y[t - k]
+        products = signal.fftconvolve(values, y[np.newaxis, ::-1], axes=-1)
+
+        # sums over the overlaps: values[k:] and y[:n - k] for k >= 0,
+        # values[:n + k] and y[-k:] for k < 0
+        zeros = np.zeros((len(values), 1))
+        sum_x = np.concatenate((zeros, np.cumsum(values, axis=-1)), axis=-1)
+        sum_xx = np.concatenate((zeros, np.cumsum(values**2, axis=-1)), axis=-1)
+        sum_y = np.concatenate(([0.0], np.cumsum(y)))
+        sum_yy = np.concatenate(([0.0], np.cumsum(y**2)))
+
+        k = np.clip(lags, -(n_points - 1), n_points - 1)
+        n = n_points - np.abs(k)
+        x_start, x_end = np.maximum(k, 0), n_points + np.minimum(k, 0)
+        y_start, y_end = np.maximum(-k, 0), n_points - np.maximum(k, 0)
+
+        s_x = sum_x[:, x_end] - sum_x[:, x_start]
+        s_xx = sum_xx[:, x_end] - sum_xx[:, x_start]
+        s_y = sum_y[y_end] - sum_y[y_start]
+        s_yy = sum_yy[y_end] - sum_yy[y_start]
+        s_xy = products[:, k + n_points - 1]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r = (n * s_xy - s_x * s_y) / np.sqrt(
+                (n * s_xx - s_x**2) * (n * s_yy - s_y**2)
+            )
+        # lags beyond the series, or with too short overlaps, are undefined
+        r[:, (np.abs(lags) != np.abs(k)) | (n < 3)] = np.nan
+
+        all_corr.append(np.clip(r, -1.0, 1.0))
+
+    correlations = np.array(all_corr).reshape(len(all_corr), -1, len(lags))
+
+    magnitude = np.nan_to_num(np.abs(correlations), nan=-1.0)
+    peak = np.argmax(magnitude, axis=-1)
+    peak_r = np.take_along_axis(correlations, peak[..., np.newaxis], axis=-1)[..., 0]
+    peak_lag = np.where(np.isnan(peak_r), np.nan, lags[peak])
+
+    return {
+        "lags": lags,
+        "correlations": correlations,
+        "peak_lag": peak_lag,
+        "peak_r": peak_r,
+    }
+
+
+def correlation_colours(correlations, limit=None):
+    """
+    Find the hex colours of correlation values on a colour scale symmetric
+    around zero, from the lookup table CORRELATION_COLOURS.
+
+    Parameters
+    ----------
+    correlations: numpy array
+    limit: float or None
+        Correlation value at the ends of the colour scale. The largest
+        absolute value in correlations if None.
+
+    Returns
+    -------
+    colours: numpy array
+        Hex colours with the shape of correlations.
+    """
+
+    correlations = np.asarray(correlations, dtype=float)
+    if limit is None:
+        limit = np.nanmax(np.abs(correlations))
+
+    ### multiplication factor to quantize the correlation values to 'cmap' steps ###
+    mult = 360 / (2 * limit)
+    conv_val = 360 - (correlations + limit) * mult
+    steps = 360 - np.trunc(conv_val).astype(int)
+
+    return CORRELATION_COLOURS[np.clip(steps, 0, 360)]
+
+
 def correlation(val, flow, interval):
     """
     Find the Pearson correlation between the differential of the Ca(OH)2 input flow and compound output
@@ -172,56 +820,142 @@ def correlation(val, flow, interval):
     """
 
     ### calculate Pearson correlation at different time intervals betweeen input flow and output compounds ###
-    all_corr = []
-    ### iterates through differential at time scales of time interval ###
-    for a, x in enumerate(flow):
-        corr = []
-        ### iterates through compounds for respective time scale of flow ###
-        for y in val[a]:
-            ### Pearson correlation ###
-            c = stats.pearsonr(y, x[0])
-            corr.append(c[0])
-        all_corr.append(corr)
-
-    ### calculate largest positive/negative correlation value in data for color scale ###
-    corr_range = []
-    flat = np.array(all_corr).flatten()
-    if np.amax(flat) > abs(np.amin(flat)):
-        value = np.amax(flat)
-        corr_range = [-value, value]
-    elif abs(np.amin(flat)) > np.amax(flat):
-        value = abs(np.amin(flat))
-        corr_range = [-value, value]
-
-    ### color map to express calculated correlation value ###
-    cmap = mpl.colors.LinearSegmentedColormap.from_list(
-        "",
-        ["midnightblue", "#0000D6", "lightskyblue", "white", "pink", "red", "maroon"],
-        N=360,
-    )
+    all_corr = pearson_correlations(val, flow)
 
-    ### multiplication factor for to  calculate color for each correlation value from 'cmap' ###
-    mult = 360 / (abs(corr_range[0]) + corr_range[1])
+    ### colours on a scale spanning the largest positive/negative correlation value ###
+    colours = correlation_colours(all_corr)
 
-    ### calculate colours for each correlation value and put each color in list with corresponding correlation value ###
     correlation = []
     for a, x in enumerate(interval):
-        ### list of correlations for each time interval ###
-        l_col = []
-        for y in all_corr[a]:
-            ### calculate color value from correlation value ###
-            conv_val = 360 - (y + corr_range[1]) * mult
-            ### create list with correlation value and corresponding hex color ###
-            l_col.append([y, mcolors.rgb2hex(cmap(360 - int(conv_val)))])
-        ### list that contains lists for different time scales ###
-        correlation.append(l_col)
+        correlation.append([[y, c] for y, c in zip(all_corr[a], colours[a].tolist())])
 
     return correlation
 
 
+def nonzero_means(traces):
+    """
+    Calculate the averages of the non-zero values of traces, leaving out
+    missing values (nan).
+
+    Parameters
+    ----------
+    traces: numpy array
+        Traces along the last axis, e.g. an experiment x compound x time
+        array.
+
+    Returns
+    -------
+    means: numpy array
+        With the shape of traces without the time axis, nan for traces
+        without non-zero values.
+    """
+
+    traces = np.asarray(traces, dtype=float)
+    mask = (traces != 0) & ~np.isnan(traces)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(mask, traces, 0.0).sum(axis=-1) / mask.sum(axis=-1)
+
+
+def relative_difference(mean_1, mean_2, present_1, present_2):
+    """
+    Calculate the relative difference between perturbed state (mean_2) and
+    steady state (mean_1) averages. The arrays are broadcast together.
+
+    Parameters
+    ----------
+    mean_1, mean_2: numpy arrays
+        Averages of the non-zero values in the steady and perturbed states.
+    present_1, present_2: numpy arrays
+        Whether the compounds are present in the steady and perturbed states.
+
+    Returns
+    -------
+    shifts: numpy array
+    """
+
+    mean_1 = np.where(present_1, mean_1, 0.0)
+    mean_2 = np.where(present_2, mean_2, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shifts = (mean_2 - mean_1) / mean_1
+
+    return np.where(np.isnan(shifts), 0.0, shifts)
+
+
+def relative_shifts(traces, present, references, perturbed):
+    """
+    Calculate the relative difference between the average of each compound
+    in perturbed experiments and in reference (steady state) experiments.
+
+    Zero values are left out of the averages. If a compound is not present in
+    a reference experiment, its series is defined to be a sequence of zeros,
+    so an increase gives inf. Undefined shifts (e.g. compounds absent from the
+    perturbed experiment) are 0.
+
+    Parameters
+    ----------
+    traces: numpy array
+        Experiment x compound x time array, e.g. from
+        experiment_store.compound_traces.
+    present: numpy array
+        Experiment x compound boolean array.
+    references: list[int]
+        Experiment indices of the reference experiments.
+    perturbed: list[int]
+        Experiment indices of the perturbed experiments.
+
+    Returns
+    -------
+    shifts: numpy array
+        Reference x perturbed x compound array.
+    """
+
+    references = np.asarray(references, dtype=int)
+    perturbed = np.asarray(perturbed, dtype=int)
+    means = nonzero_means(traces)
+
+    return relative_difference(
+        means[references][:, np.newaxis],
+        means[perturbed][np.newaxis],
+        present[references][:, np.newaxis],
+        present[perturbed][np.newaxis],
+    )
+
+
+def normalized_shifts(shifts, axis=0):
+    """
+    Normalize relative shifts between -1 and 1 by the largest finite absolute
+    shift of each compound. Infinite shifts are replaced with 1.
+
+    Parameters
+    ----------
+    shifts: numpy array
+        Compounds along the last axis.
+    axis: int or tuple of int
+        Axes over which the largest shift is found, e.g. the experiment axis.
+
+    Returns
+    -------
+    normalized: numpy array
+        With the shape of shifts.
+    """
+
+    shifts = np.asarray(shifts, dtype=float)
+    infinite = np.isinf(shifts)
+
+    l_max = np.max(np.abs(np.where(infinite, 0.0, shifts)), axis=axis, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normalized = shifts / l_max
+    normalized[infinite] = 1
+
+    return normalized
+
+
 def difference_average(data_report_1, data_report_2, list_comp, dic_rel_diff):
     """
-    Calculate relative difference between perturbed state versus the steady state compound average in a data report.
+    Calculate relative difference between perturbed state versus the steady state compound average in a data report
+    (see relative_shifts).
 
     Parameters
     ----------
@@ -234,45 +968,16 @@ def difference_average(data_report_1, data_report_2, list_comp, dic_rel_diff):
     -------
     relative difference per compound: dict()
     """
-    steady_state_comp = [*data_report_1.data]
-    perturbed_state_comp = [*data_report_2.data]
-
-    steady_state = data_report_1.data
-    perturbed_state = data_report_2.data
-
-    mean_1 = []
-    mean_2 = []
-
-    # if a compound is not present in a data report, its series is defined to
-    # be a sequence of zeros
-    for ind, compound in list_comp:
-        token = "no_comp"
-        # find steady state concentration for compound, zero values are removed from list
-        for x in steady_state_comp:
-            if compound in x:
-                token = x
-        if token in steady_state_comp:
-            mean_1 = steady_state[token]
-            mean_1 = [i for i in mean_1 if i != 0]
-        else:
-            mean_1 = [0]
-
-        # find perturbed state concentration for compound, zero values are removed from list
-        token = "no_comp"
-        for x in perturbed_state_comp:
-            if compound in x:
-                token = x
-        if token in perturbed_state_comp:
-            mean_2 = perturbed_state[token]
-            mean_2 = [i for i in mean_2 if i != 0]
-        else:
-            mean_2 = np.nan
 
-        # calculate relative difference from with steady state 'mean_1' and perturbed state 'mean_2'
-        result = (np.mean(mean_2) - np.mean(mean_1)) / np.mean(mean_1)
-        if np.isnan(result) == True:
-            result = 0
+    samples, keys = compound_samples([data_report_1, data_report_2], list_comp)
+
+    traces = np.full((2, len(list_comp), max(s.shape[1] for s in samples)), np.nan)
+    for s, sample in enumerate(samples):
+        traces[s, :, : sample.shape[1]] = sample
+    present = np.array([[k != "no_comp" for k in key] for key in keys], dtype=bool)
 
+    shifts = relative_shifts(traces, present, [0], [1])[0, 0]
+    for (ind, _), result in zip(list_comp, shifts):
         dic_rel_diff[ind].append(result)
 
     return dic_rel_diff
@@ -281,6 +986,7 @@ def difference_average(data_report_1, data_report_2, list_comp, dic_rel_diff):
 def normalized_difference(dic_rel_diff, list_comp):
     """
     Normalizes the relative difference from steady steate for each of the observed compounds over EXP001 - EXP012
+    (see normalized_shifts).
 
     Parameters
     ----------
@@ -291,30 +997,12 @@ def normalized_difference(dic_rel_diff, list_comp):
     -------
     relative difference per compound: dict()
     """
-    # calculate normalized difference for each compound
-    for ind, _ in list_comp:
-        c_list = dic_rel_diff[ind]
-        num_list = []
-        # exclude inf for finding largest difference from steady state
-        for i in c_list:
-            if np.isinf(i) == False:
-                num_list.append(i)
-
-        # calculate minumum and maximum value
-        l_max = np.amax(num_list)
-        l_min = np.amin(num_list)
-
-        # set l_max to largest difference in list
-        if abs(l_min) > l_max:
-            l_max = abs(l_min)
-
-        # normalize list for compound with l_max
-        norm = []
-        for i in c_list:
-            if np.isinf(i) == True:
-                norm.append(1)
-            else:
-                norm.append(i / l_max)
-        # for compound replace relative difference list with normalized list in dictionary
-        dic_rel_diff[ind] = norm
+
+    shifts = np.array([dic_rel_diff[ind] for ind, _ in list_comp], dtype=float)
+    normalized = normalized_shifts(shifts.T, axis=0).T
+
+    # for compound replace relative difference list with normalized list in dictionary
+    for (ind, _), norm in zip(list_comp, normalized):
+        dic_rel_diff[ind] = norm.tolist()
+
     return dic_rel_diff
@@ -0,0 +1,428 @@
+"""
+Binary sidecar cache for parsed data reports.
+
+The parsed contents of a data report .csv file are stored next to it in a
+directory of .npy files (one per column block) with a JSON index, e.g.
+EXP013_Data.csv -> EXP013_Data.cache/. The cache is keyed by the size,
+modification time and content hash of the source file and is rebuilt when it
+is stale. Warm loads memory-map the arrays instead of parsing the .csv file.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+from pathlib import Path
+
+from processing_scripts_formose import data_report, parallel
+
+CACHE_VERSION = 2
+INDEX_FILE = "index.json"
+
+
+def cache_path(file):
+    """
+    Get the path of the cache directory for a data report file.
+
+    Parameters
+    ----------
+    file: pathlib Path or str
+        Path to the data report .csv file.
+
+    Returns
+    -------
+    path: pathlib Path
+    """
+
+    file = Path(file)
+
+    return file.parent / f"{file.stem}.cache"
+
+
+def file_hash(file):
+    """
+    Calculate the SHA-256 hash of the contents of a file.
+
+    Parameters
+    ----------
+    file: pathlib Path or str
+
+    Returns
+    -------
+    digest: str
+    """
+
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def source_key(file, digest=None):
+    """
+    Create the key identifying the state of a source file.
+
+    Parameters
+    ----------
+    file: pathlib Path or str
+    digest: str or None
+        Content hash of the file. Calculated if not given.
+
+    Returns
+    -------
+    key: dict
+    """
+
+    stat = os.stat(file)
+    if digest is None:
+        digest = file_hash(file)
+
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+
+
+def read_index(file):
+    """
+    Read the index of the cache for a data report file.
+
+    Parameters
+    ----------
+    file: pathlib Path or str
+        Path to the data report .csv file.
+
+    Returns
+    -------
+    index: dict or None
+        None if there is no readable cache.
+    """
+
+    index_file = cache_path(file) / INDEX_FILE
+    if not index_file.exists():
+        return None
+
+    try:
+        with open(index_file, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if index.get("version") != CACHE_VERSION:
+        return None
+
+    return index
+
+
+def is_current(file, index=None, nan_value=0.0):
+    """
+    Check whether the cache for a data report file is up to date.
+
+    The size and modification time of the source file are compared first.
+    If only the modification time differs, the content hash decides, and the
+    stored modification time is refreshed when the contents are unchanged
+    and the cache folder is writable.
+
+    Parameters
+    ----------
+    file: pathlib Path or str
+        Path to the data report .csv file.
+    index: dict or None
+        Cache index, read from disk if not given.
+    nan_value: float
+        Value used in place of missing values when the report was parsed.
+
+    Returns
+    -------
+    current: bool
+    """
+
+    if index is None:
+        index = read_index(file)
+    if index is None:
+        return False
+    if index["nan_value"] != repr(float(nan_value)):
+        return False
+
+    stat = os.stat(file)
+    source = index["source"]
+    if stat.st_size != source["size"]:
+        return False
+    if stat.st_mtime_ns == source["mtime_ns"]:
+        return True
+    if file_hash(file) != source["sha256"]:
+        return False
+
+    source["mtime_ns"] = stat.st_mtime_ns
+    try:
+        write_index(file, index)
+    except OSError:
+        # e.g. read-only data folders: the contents are hashed again next time
+        pass
+
+    return True
+
+
+def write_index(file, index):
+    """
+    Write the index of the cache for a data report file.
+
+    Parameters
+    ----------
+    file: pathlib Path or str
+        Path to the data report .csv file.
+    index: dict
+
+    Returns
+    -------
+    None
+    """
+
+    index_file = cache_path(file) / INDEX_FILE
+    temp_file = index_file.with_suffix(f".tmp{os.getpid()}")
+    with open(temp_file, "w") as f:
+        json.dump(index, f)
+    os.replace(temp_file, index_file)
+
+
+def save_array(directory, name, array):
+    """
+    Write an array of the cache atomically.
+
+    The array is written to a temporary file that then replaces the cached
+    file, so reports that still memory-map the old file keep its contents and
+    other processes never map a partially written file.
+
+    Parameters
+    ----------
+    directory: pathlib Path
+        Cache directory.
+    name: str
+        Name of the array, without extension.
+    array: numpy array
+
+    Returns
+    -------
+    None
+    """
+
+    temp_file = directory / f"{name}.tmp{os.getpid()}.npy"
+    np.save(temp_file, array)
+    os.replace(temp_file, directory / f"{name}.npy")
+
+
+def write_cache(report, file, nan_value=0.0):
+    """
+    Store a parsed data report in the cache for its source file.
+
+    Parameters
+    ----------
+    report: data_report.data_report
+        Data report parsed from file.
+    file: pathlib Path or str
+        Path to the data report .csv file.
+    nan_value: float
+        Value used in place of missing values when the report was parsed.
+
+    Returns
+    -------
+    None
+    """
+
+    file = Path(file)
+    key = source_key(file)
+
+    directory = cache_path(file)
+    os.makedirs(directory, exist_ok=True)
+
+    # invalidate the old cache before its arrays are overwritten
+    index_file = directory / INDEX_FILE
+    if index_file.exists():
+        os.remove(index_file)
+
+    save_array(directory, "series_values", np.asarray(report.series_values))
+    save_array(directory, "data", report.data.array)
+    save_array(directory, "errors", report.errors.array)
+
+    scalar_conditions = dict()
+    profile_conditions = []
+    for c in report.conditions:
+        value = report.conditions[c]
+        if type(value) == float:
+            scalar_conditions[c] = value
+        else:
+            save_array(
+                directory, f"conditions_{len(profile_conditions)}", np.asarray(value)
+            )
+            profile_conditions.append(c)
+
+    index = {
+        "version": CACHE_VERSION,
+        "source": key,
+        "nan_value": repr(float(nan_value)),
+        "filename": report.filename,
+        "experiment_code": report.experiment_code,
+        "series_unit": report.series_unit,
+        "condition_order": [*report.conditions],
+        "scalar_conditions": scalar_conditions,
+        "profile_conditions": profile_conditions,
+        "analysis_details": report.analysis_details,
+        "data": [*report.data],
+        "errors": [*report.errors],
+    }
+
+    write_index(file, index)
+
+
+def read_cache(file, index=None, mmap_mode="r"):
+    """
+    Create a data report from the cache of a data report file.
+
+    The arrays are memory-mapped, so the traces in data and errors are views
+    into the cached files rather than copies.
+
+    Parameters
+    ----------
+    file: pathlib Path or str
+        Path to the data report .csv file.
+    index: dict or None
+        Cache index, read from disk if not given.
+    mmap_mode: str or None
+        Passed to numpy.load. None loads the arrays into memory.
+
+    Returns
+    -------
+    report: data_report.data_report
+    """
+
+    if index is None:
+        index = read_index(file)
+
+    directory = cache_path(file)
+    load = lambda name: np.load(directory / f"{name}.npy", mmap_mode=mmap_mode)
+
+    report = data_report.data_report()
+    report.filename = index["filename"]
+    report.experiment_code = index["experiment_code"]
+    report.series_unit = index["series_unit"]
+    report.series_values = load("series_values")
+
+    profiles = index["profile_conditions"]
+    for c in index["condition_order"]:
+        if c in index["scalar_conditions"]:
+            report.conditions[c] = index["scalar_conditions"][c]
+        else:
+            report.conditions[c] = load(f"conditions_{profiles.index(c)}")
+
+    report.analysis_details = index["analysis_details"]
+
+    report.data = data_report.trace_matrix(load("data"), index["data"])
+    report.errors = data_report.trace_matrix(load("errors"), index["errors"])
+
+    return report
+
+
+def load_data_report(file, use_cache=True, mmap_mode="r", nan_value=0.0):
+    """
+    Load a data report, using the binary cache next to the file if it is up
+    to date and (re)building it otherwise.
+
+    Parameters
+    ----------
+    file: pathlib Path or str
+        Path to the data report .csv file.
+    use_cache: bool
+        If False, the .csv file is parsed and the cache is not touched.
+    mmap_mode: str or None
+        Passed to numpy.load for warm loads.
+    nan_value: float
+        Value used in place of missing values in the data and errors.
+
+    Returns
+    -------
+    report: data_report.data_report
+    """
+
+    if not use_cache:
+        return data_report.data_report(file=file, nan_value=nan_value)
+
+    index = read_index(file)
+    if not is_current(file, index=index, nan_value=nan_value):
+        report = data_report.data_report(file=file, nan_value=nan_value)
+        try:
+            write_cache(report, file, nan_value=nan_value)
+        except OSError:
+            # e.g. read-only data folders: fall back to the parsed report
+            return report
+        index = read_index(file)
+
+    return read_cache(file, index=index, mmap_mode=mmap_mode)
+
+
+def update_cache(job):
+    """
+    Parse a data report file and write its cache if the cache is stale.
+
+    Used by the worker processes of load_data_reports.
+
+    Parameters
+    ----------
+    job: tuple(pathlib Path or str, float)
+        Path to the data report .csv file and nan_value (see
+        load_data_report).
+
+    Returns
+    -------
+    None
+    """
+
+    file, nan_value = job
+    if is_current(file, nan_value=nan_value):
+        return
+
+    report = data_report.data_report(file=file, nan_value=nan_value)
+    try:
+        write_cache(report, file, nan_value=nan_value)
+    except OSError:
+        # load_data_report will parse the file again in the calling process
+        pass
+
+
+def load_data_reports(files, workers=1, use_cache=True, mmap_mode="r", nan_value=0.0):
+    """
+    Load several data reports, parsing the files with stale caches in
+    parallel.
+
+    The worker processes write the parsed reports to the binary cache, from
+    which they are memory-mapped in the calling process, so no parsed data is
+    sent between processes.
+
+    Parameters
+    ----------
+    files: list[pathlib Path or str]
+        Paths to the data report .csv files.
+    workers: int or None
+        Number of worker processes, 1 runs in this process. None uses
+        all available cores.
+    use_cache: bool
+        If False, the files are parsed in this process without the cache.
+    mmap_mode: str or None
+        Passed to numpy.load.
+    nan_value: float
+        Value used in place of missing values in the data and errors.
+
+    Returns
+    -------
+    reports: list[data_report.data_report]
+        In the order of files.
+    """
+
+    if use_cache:
+        stale = [f for f in files if not is_current(f, nan_value=nan_value)]
+        parallel.map_jobs(update_cache, [(f, nan_value) for f in stale], workers)
+
+    return [
+        load_data_report(
+            f, use_cache=use_cache, mmap_mode=mmap_mode, nan_value=nan_value
+        )
+        for f in files
+    ]
@@ -1,5 +1,569 @@
+import time
 import numpy as np
 from pathlib import Path
+from collections.abc import MutableMapping
+
+
+def split_line(line):
+    """
+    Split a line of a data report into its non-empty comma-separated fields.
+
+    Lines in data reports are padded with trailing commas, which are stripped
+    before splitting.
+
+    Parameters
+    ----------
+    line: str
+
+    Returns
+    -------
+    fields: list[str]
+    """
+
+    fields = line.rstrip("\r\n").rstrip(",").split(",")
+    if "" in fields:
+        fields = [e for e in fields if e != ""]
+
+    return fields
+
+
+def read_sections(file, handlers):
+    """
+    Tokenize the lines of a data report in a single pass.
+
+    Lines between start_<section> and end_<section> markers are passed to
+    handlers[<section>] along with their byte offset in the file. Only the
+    first field of a line is split off to find the section markers, so the
+    handlers decide how much of each line is parsed. Lines outside of a known
+    section are split and yielded.
+
+    Parameters
+    ----------
+    file: file object
+        Opened in binary mode.
+    handlers: dict
+        Callables accepting a line (str) and its offset (int), keyed by
+        section name.
+
+    Returns
+    -------
+    _: generator of list[str]
+        Fields of the lines outside of the handled sections, including the
+        end_<section> markers of handled sections.
+    """
+
+    handler = None
+    end_token = ""
+    offset = 0
+    for raw in file:
+        line = raw.decode("latin-1")
+        token = line.split(",", 1)[0].strip()
+        if handler is not None:
+            if token == end_token:
+                handler = None
+                yield [token]
+            else:
+                handler(line, offset)
+        elif token.startswith("start_") and token[6:] in handlers:
+            handler = handlers[token[6:]]
+            end_token = f"end_{token[6:]}"
+        else:
+            ins = split_line(line)
+            if len(ins) > 0:
+                yield ins
+
+        offset += len(raw)
+
+
+def parse_values(text):
+    """
+    Parse a comma-separated string of numbers into a 1D numpy array.
+
+    Parameters
+    ----------
+    text: str
+
+    Returns
+    -------
+    values: numpy array
+    """
+
+    return np.fromstring(text.rstrip("\r\n").rstrip(","), dtype=float, sep=",")
+
+
+def decode_section(lines, nan_value=0.0):
+    """
+    Decode a tabular section of a data report (e.g. data or errors) into a
+    header and a 2D numpy array.
+
+    All of the values in the section are parsed in a single call to
+    numpy.fromstring.
+
+    Parameters
+    ----------
+    lines: list[str]
+        Lines of the section. The first line is the header.
+    nan_value: float
+        Value used in place of missing (nan) values. Use numpy.nan to keep
+        them.
+
+    Returns
+    -------
+    header: list[str]
+    values: numpy array
+        One row per column of the section.
+    """
+
+    header = split_line(lines[0])
+    rows = [x.rstrip("\r\n").rstrip(",") for x in lines[1:]]
+    rows = [x for x in rows if x != ""]
+
+    values = np.fromstring(",".join(rows), dtype=float, sep=",")
+    if values.size != len(rows) * len(header):
+        raise ValueError(
+            f"Section with header {header[0]} does not have {len(header)} "
+            "values on every line."
+        )
+
+    values = np.ascontiguousarray(values.reshape(len(rows), len(header)).T)
+    if not np.isnan(nan_value):
+        values[np.isnan(values)] = nan_value
+
+    return header, values
+
+
+class lazy_conditions(MutableMapping):
+    """
+    A dict-like container for the conditions of a data report.
+
+    Conditions with a single value are stored as floats. For conditions with
+    a series of values (e.g. flow profiles), only the position of their line
+    in the data report file is recorded; the values are parsed the first
+    time they are accessed.
+    """
+
+    def __init__(self, file=None):
+        """
+        file: pathlib Path, str or None
+            Path to the data report file containing the conditions.
+        """
+        self.file = file
+        self._values = dict()
+        self._locations = dict()
+
+    def add_line(self, line, offset):
+        """
+        Add a condition from a line of the conditions section of the file.
+
+        Parameters
+        ----------
+        line: str
+        offset: int
+            Byte offset of the line in the file.
+
+        Returns
+        -------
+        None
+        """
+
+        name, _, values = line.partition(",")
+        values = values.rstrip("\r\n").rstrip(",")
+        if name == "":
+            return
+
+        if values == "":
+            self._values[name] = np.array([])
+        elif "," in values:
+            self._values[name] = None
+            self._locations[name] = (offset, len(line.encode("latin-1")))
+        else:
+            self._values[name] = float(values)
+
+    def read_values(self, name):
+        """
+        Parse the values of a condition from the data report file.
+
+        Parameters
+        ----------
+        name: str
+
+        Returns
+        -------
+        values: numpy array
+        """
+
+        offset, length = self._locations[name]
+        with open(self.file, "rb") as f:
+            f.seek(offset)
+            line = f.read(length).decode("latin-1")
+
+        return parse_values(line.partition(",")[2])
+
+    def __getitem__(self, name):
+        if name in self._locations:
+            self._values[name] = self.read_values(name)
+            del self._locations[name]
+
+        if name not in self._values:
+            raise KeyError(name)
+
+        return self._values[name]
+
+    def __setitem__(self, name, value):
+        self._locations.pop(name, None)
+        self._values[name] = value
+
+    def __delitem__(self, name):
+        self._locations.pop(name, None)
+        del self._values[name]
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        entries = []
+        for name, value in self._values.items():
+            if name in self._locations:
+                value = "<not loaded>"
+            else:
+                value = repr(value)
+            entries.append(f"{name!r}: {value}")
+
+        return "{" + ", ".join(entries) + "}"
+
+
+def compound_token(name):
+    """
+    Get the compound token (e.g. SMILES) of an entry name such as
+    "O=C(CO)CO/ M (6.564)".
+
+    Parameters
+    ----------
+    name: str
+
+    Returns
+    -------
+    token: str
+    """
+
+    return name.split("/")[0]
+
+
+def compound_index(entries):
+    """
+    Create an exact-match index of compound tokens to entry names.
+
+    Parameters
+    ----------
+    entries: iterable of str or trace_matrix
+        Entry names, e.g. the keys of data_report.data. The cached index of a
+        trace_matrix is returned. A ValueError is raised if a compound token
+        is found in more than one entry, i.e. if repeated entries were not
+        removed (see clean_data_reports).
+
+    Returns
+    -------
+    index: dict
+        Entry names keyed by compound token.
+    """
+
+    if isinstance(entries, trace_matrix):
+        return entries.compounds
+
+    index = dict()
+    for name in entries:
+        token = compound_token(name)
+        if token in index:
+            raise ValueError(
+                f"Ambiguous compound {token}: found in entries {index[token]} "
+                f"and {name}."
+            )
+        index[token] = name
+
+    return index
+
+
+class trace_matrix(MutableMapping):
+    """
+    A dict-like view over the rows of a 2D numpy array.
+
+    Each entry is a row of the array (e.g. a compound trace), found through an
+    index of entry names to row numbers. Getting an entry returns a view into
+    the array, not a copy.
+    """
+
+    def __init__(self, array=None, names=[]):
+        """
+        array: numpy array or None
+            2D array with one row per entry.
+        names: list[str]
+            Names of the rows in array.
+        """
+        if array is None:
+            array = np.zeros((0, 0))
+
+        if len(names) != array.shape[0]:
+            raise ValueError(
+                f"{len(names)} names given for an array with {array.shape[0]} rows."
+            )
+
+        self.array = array
+        self.index = {n: c for c, n in enumerate(names)}
+        self._compounds = None
+        # spare capacity along the time axis, used by extend()
+        self._buffer = None
+
+    @classmethod
+    def from_dict(cls, dict_container):
+        """
+        Create a trace_matrix from a dict of 1D arrays of the same length.
+
+        Parameters
+        ----------
+        dict_container: dict
+
+        Returns
+        -------
+        matrix: trace_matrix
+        """
+
+        if isinstance(dict_container, cls):
+            return dict_container
+
+        names = [*dict_container]
+        if len(names) == 0:
+            return cls()
+
+        array = np.array([dict_container[n] for n in names], dtype=float)
+        if array.ndim != 2:
+            raise ValueError("Entries must be 1D arrays of the same length.")
+
+        return cls(array, names)
+
+    @property
+    def compounds(self):
+        """
+        Entry names keyed by compound token, built once and reset when
+        entries are added or removed (see compound_index).
+        """
+        if self._compounds is None:
+            self._compounds = compound_index(list(self.index))
+
+        return self._compounds
+
+    def _make_writeable(self):
+        # arrays loaded from the cache are read-only memory maps: copy on write
+        if not self.array.flags.writeable:
+            self.array = np.array(self.array)
+
+    def extend(self, values):
+        """
+        Append timepoints (columns) to all of the entries.
+
+        The array is stored at the start of a larger buffer whose capacity is
+        doubled when it is full, so appending takes amortized constant time
+        per timepoint.
+
+        Parameters
+        ----------
+        values: numpy array
+            Entry x new timepoint array, rows in the order of the entries.
+
+        Returns
+        -------
+        None
+        """
+
+        values = np.asarray(values, dtype=float).reshape(len(self.index), -1)
+        n_rows, n_points = self.array.shape
+        n_new = values.shape[1]
+
+        buffer = self._buffer
+        if (
+            buffer is None
+            or self.array.base is not buffer
+            or buffer.shape[1] < n_points + n_new
+        ):
+            capacity = max(2 * (n_points + n_new), 16)
+            buffer = np.empty((n_rows, capacity))
+            buffer[:, :n_points] = self.array
+            self._buffer = buffer
+
+        buffer[:, n_points : n_points + n_new] = values
+        self.array = buffer[:, : n_points + n_new]
+
+    def remove(self, names):
+        """
+        Remove several entries with a single copy of the array.
+
+        Parameters
+        ----------
+        names: list[str]
+
+        Returns
+        -------
+        None
+        """
+
+        rows = [self.index[n] for n in names]
+        if len(rows) == 0:
+            return
+
+        self.array = np.delete(self.array, rows, axis=0)
+
+        removed = set(names)
+        remaining = [n for n in self.index if n not in removed]
+        self.index = {n: c for c, n in enumerate(remaining)}
+        self._compounds = None
+
+    def __getitem__(self, name):
+        return self.array[self.index[name]]
+
+    def __setitem__(self, name, value):
+        value = np.asarray(value, dtype=float)
+        if len(self.index) == 0:
+            self.array = np.zeros((0, value.shape[0]))
+
+        if value.shape != (self.array.shape[1],):
+            raise ValueError(
+                f"Entry {name} has shape {value.shape}, expected "
+                f"({self.array.shape[1]},)."
+            )
+
+        if name in self.index:
+            self._make_writeable()
+            self.array[self.index[name]] = value
+        else:
+            self.array = np.vstack((self.array, value))
+            self.index[name] = self.array.shape[0] - 1
+            self._compounds = None
+
+    def __delitem__(self, name):
+        if name not in self.index:
+            raise KeyError(name)
+
+        self.remove([name])
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+def repeat_groups(names):
+    """
+    Group entry names which share a compound token (the part of the name
+    before the first space), keeping only the groups with repeats.
+
+    Parameters
+    ----------
+    names: iterable of str
+
+    Returns
+    -------
+    groups: dict
+        Lists of entry names keyed by the repeated token.
+    """
+
+    groups = dict()
+    for name in names:
+        groups.setdefault(name.split(" ")[0], []).append(name)
+
+    return {token: groups[token] for token in groups if len(groups[token]) > 1}
+
+
+def row_reductions(arrays):
+    """
+    Calculate the sum and maximum of every row of a list of 2D arrays, with
+    one vectorized reduction per array.
+
+    Parameters
+    ----------
+    arrays: list[numpy array]
+        2D arrays, which may have different numbers of columns.
+
+    Returns
+    -------
+    sums: numpy array
+    maxima: numpy array
+        Row sums and maxima, rows of all arrays in order. Empty rows have a
+        sum of 0 and a maximum of -inf.
+    """
+
+    sums = [np.zeros(0)]
+    maxima = [np.zeros(0)]
+    for a in arrays:
+        if a.shape[1] == 0:
+            sums.append(np.zeros(a.shape[0]))
+            maxima.append(np.full(a.shape[0], -np.inf))
+        else:
+            sums.append(a.sum(axis=1))
+            maxima.append(a.max(axis=1))
+
+    return np.concatenate(sums), np.concatenate(maxima)
+
+
+def clean_data_reports(reports, threshold=None, remove_repeats=True):
+    """
+    Remove repeated entries and entries below a threshold from the data of
+    several data reports.
+
+    The row sums and maxima of all reports are calculated up front (see
+    row_reductions), repeated entries are found by hashing their compound
+    tokens (see repeat_groups) and the entries to remove from each report are
+    deleted with a single copy of its data.
+
+    Parameters
+    ----------
+    reports: list[data_report]
+    threshold: float or None
+        Entries whose maximum value is below threshold are removed. No
+        entries are removed for their values if None.
+    remove_repeats: bool
+        For each group of repeated entries, remove the entry with the lowest
+        signal sum.
+
+    Returns
+    -------
+    None
+    """
+
+    sums, maxima = row_reductions([r.data.array for r in reports])
+
+    start = 0
+    for report in reports:
+        names = [*report.data]
+        end = start + len(names)
+        remove = set()
+
+        # deleting duplicate entries: taking the entry with the higher signal
+        # using the signal sum as a discriminant.
+        if remove_repeats:
+            for group in repeat_groups(names).values():
+                group_sums = [sums[start + report.data.index[g]] for g in group]
+                remove.add(group[int(np.argmin(group_sums))])
+
+        # remove entries whose concentrations/integrals do not cross a defined
+        # boundary
+        if threshold is not None:
+            below = np.flatnonzero(maxima[start:end] < threshold)
+            remove.update(names[b] for b in below)
+
+        report.data.remove([n for n in names if n in remove])
+        start = end
 
 
 class data_report:
@@ -9,24 +573,54 @@ class data_report:
     Adapted from https://github.com/Will-Robin/NorthNet
     """
 
-    def __init__(self, file=""):
+    def __init__(self, file="", nan_value=0.0):
         """
         file: pathlib Path or str
             Path to file
+        nan_value: float
+            Value used in place of missing values in the data and errors.
         """
         self.filename = "not specified"
         self.experiment_code = "not specified"
-        self.conditions = dict()
+        self.conditions = lazy_conditions()
         self.analysis_details = dict()
         self.series_values = np.array([])
         self.series_unit = "not specified"
-        self.data = dict()
-        self.errors = dict()
+        self.data = trace_matrix()
+        self.errors = trace_matrix()
+
+        # position of the data section in the source file and buffer for the
+        # series values, for update()
+        self._data_source = None
+        self._series_buffer = None
 
         if file == "":
             pass
         else:
-            self.read_from_file(file)
+            self.read_from_file(file, nan_value=nan_value)
+
+    @property
+    def data(self):
+        """
+        Compound traces: a trace_matrix over a compound x time array.
+        """
+        return self._data
+
+    @data.setter
+    def data(self, traces):
+        self._data = trace_matrix.from_dict(traces)
+
+    @property
+    def errors(self):
+        """
+        Errors of the compound traces: a trace_matrix over a compound x time
+        array.
+        """
+        return self._errors
+
+    @errors.setter
+    def errors(self, traces):
+        self._errors = trace_matrix.from_dict(traces)
 
     def import_file_section(self, file, start_token, end_token):
         """
@@ -41,7 +635,6 @@ class data_report:
             String in line to end reading file from.
         """
 
-        spl_lin = lambda x: [e for e in x.strip("\n").split(",") if e != ""]
         readstate = False
         c_set = []
         with open(file, "r", encoding="latin-1") as f:
@@ -52,96 +645,295 @@ class data_report:
                 if end_token in line:
                     readstate = False
                 if readstate:
-                    newline = spl_lin(line)
+                    newline = split_line(line)
                     c_set.append(newline)
 
         return c_set
 
-    def read_from_file(self, file):
+    def read_from_file(self, file, nan_value=0.0):
         """
         Read a data report from a formatted .csv file.
 
+        The file is read once: each line is tokenized and sent to the handler
+        of the section it belongs to. Conditions with a series of values are
+        parsed when they are first accessed (see lazy_conditions).
+
         Parameters
         ----------
         file: pathlib Path or str
+        nan_value: float
+            Value used in place of missing values in the data and errors.
+            Use numpy.nan to keep them.
         """
-        spl_lin = lambda x: [e for e in x.strip("\n").split(",") if e != ""]
 
         if type(file) == str:
             file = Path(file)
 
         self.filename = file.name
+        self.conditions = lazy_conditions(file)
 
-        with open(file, "r", encoding="latin-1") as f:
-            for line in f:
-                ins = spl_lin(line)
-                if "Dataset" in line:
-                    self.experiment_code = ins[1]
+        analysis = []
+        dataset = []
+        errors = []
 
-        condset = self.import_file_section(file, "start_conditions", "end_conditions")
+        def add_fields(section):
+            def handler(line, offset):
+                fields = split_line(line)
+                if len(fields) > 0:
+                    section.append(fields)
 
-        for c in condset:
-            entry = [float(x) for x in c[1:]]
-            if len(entry) == 1:
-                self.conditions[c[0]] = entry[0]
-            else:
-                self.conditions[c[0]] = np.array(entry)
+            return handler
 
-        dataset = self.import_file_section(file, "start_data", "end_data")
+        def add_line(section):
+            def handler(line, offset):
+                section.append(line)
 
-        transposed_datalines = [list(i) for i in zip(*dataset)]
-        d_out = dict()
-        for s in transposed_datalines:
-            d_out[s[0]] = np.array([0 if x == "nan" else float(x) for x in s[1:]])
+            return handler
 
-        self.series_unit = dataset[0][0]
-        self.series_values = d_out[self.series_unit]
+        # lines still being written (no line ending yet) are left for update()
+        data_source = {"file": file, "offset": 0, "complete": False}
 
-        del d_out[self.series_unit]
+        def add_data_line(line, offset):
+            if line.endswith("\n"):
+                dataset.append(line)
+                data_source["offset"] = offset + len(line.encode("latin-1"))
 
-        self.data = d_out
+        handlers = {
+            "conditions": self.conditions.add_line,
+            "analysis_details": add_fields(analysis),
+            "data": add_data_line,
+            "errors": add_line(errors),
+        }
 
-        errors = self.import_file_section(file, "start_errors", "end_errors")
+        with open(file, "rb") as f:
+            for ins in read_sections(f, handlers):
+                if ins[0] == "Dataset":
+                    self.experiment_code = ins[1]
+                elif ins[0] == "end_data":
+                    data_source["complete"] = True
+
+            if len(dataset) == 0:
+                # no complete line of the data section has been written yet
+                data_source["offset"] = f.tell()
+
+        data_source["header"] = None
+        data_source["nan_value"] = nan_value
+        data_source["errors_read"] = data_source["complete"]
+        self._data_source = data_source
 
-        if len(errors) == 0:
-            self.errors = {d: np.zeros(len(self.series_values)) for d in self.data}
-        else:
-            transposed_error_lines = [list(i) for i in zip(*errors)]
-            errors_out = dict()
-            for s in transposed_error_lines:
-                errors_out[s[0]] = np.array(
-                    [0 if x == "nan" else float(x) for x in s[1:]]
-                )
-            del errors_out[self.series_unit]
-            self.errors = errors_out
-
-        analysis = self.import_file_section(
-            file, "start_analysis_details", "end_analysis_details"
-        )
         for a in analysis:
             self.analysis_details[a[0]] = [x for x in a[1:]]
 
-    def to_numpy(self):
+        if len(dataset) == 0:
+            # the report is left empty, the header is read by update()
+            return
+
+        data_source["header"] = dataset[0]
+        header, values = decode_section(dataset, nan_value=nan_value)
+
+        self.series_unit = header[0]
+        self.series_values = values[0]
+        self.data = trace_matrix(values[1:], header[1:])
+
+        if len(errors) > 0:
+            header, values = decode_section(errors, nan_value=nan_value)
+            self.errors = trace_matrix(values[1:], header[1:])
+        elif data_source["complete"]:
+            self.errors = trace_matrix(np.zeros(self.data.array.shape), [*self.data])
+        else:
+            # the errors section follows the data section, which is still
+            # being written (see update_errors)
+            self.errors = trace_matrix(
+                np.full(self.data.array.shape, np.nan), [*self.data]
+            )
+
+    @property
+    def data_complete(self):
+        """
+        True unless the data section of the source file is still being
+        written (it has no end_data marker yet).
+        """
+        if self._data_source is None:
+            return True
+
+        return self._data_source["complete"]
+
+    def update(self, callback=None):
         """
-        Convert the data in the data report into a 2D numpy array.
+        Read the rows appended to the data section of the source file since
+        it was last read.
 
-        Each compound is a row.
+        Only the new part of the file is parsed. The new timepoints are
+        appended to series_values, data and errors (as nan, i.e. missing) in
+        amortized constant time per row. If the header of the data section
+        had not been written when the file was read, it is read first. Once
+        the data section is complete, the errors section is read (see
+        update_errors).
 
         Parameters
         ----------
+        callback: callable or None
+            Called as callback(report, series_values, values) if rows were
+            added, with the new series values and the new values as a
+            compound x time array in the row order of self.data.
 
         Returns
         -------
-        array: numpy array
+        n_rows: int
+            Number of rows added.
+        """
+
+        source = self._data_source
+        if source is None:
+            raise ValueError("The data report was not read from a file.")
+
+        lines = [] if source["header"] is None else [source["header"]]
+        with open(source["file"], "rb") as f:
+            f.seek(source["offset"])
+            for raw in f:
+                line = raw.decode("latin-1")
+                if line.split(",", 1)[0].strip() == "end_data":
+                    source["complete"] = True
+                    source["errors_offset"] = source["offset"] + len(raw)
+                    break
+                if not line.endswith("\n"):
+                    break
+
+                lines.append(line)
+                source["offset"] += len(raw)
+
+        if source["header"] is None:
+            if len(lines) == 0:
+                return 0
+
+            source["header"] = lines[0]
+            header = split_line(lines[0])
+            self.series_unit = header[0]
+            self.data = trace_matrix(np.zeros((len(header) - 1, 0)), header[1:])
+            self.errors = trace_matrix(np.zeros((len(header) - 1, 0)), header[1:])
+
+        header, values = decode_section(lines, nan_value=source["nan_value"])
+        n_rows = values.shape[1]
+        if n_rows == 0:
+            self.update_errors()
+            return 0
+
+        columns = {h: c for c, h in enumerate(header)}
+        new_values = values[[columns[d] for d in self.data]]
+
+        if (
+            self._series_buffer is None
+            or self._series_buffer[1] is not self.series_values
+        ):
+            series = trace_matrix(self.series_values[np.newaxis], [self.series_unit])
+        else:
+            series = self._series_buffer[0]
+
+        series.extend(values[:1])
+        self.series_values = series.array[0]
+        self._series_buffer = (series, self.series_values)
+
+        self.data.extend(new_values)
+        if len(self.errors) > 0:
+            self.errors.extend(np.full((len(self.errors), n_rows), np.nan))
+
+        self.update_errors()
+
+        if callback is not None:
+            callback(self, values[0], new_values)
+
+        return n_rows
+
+    def update_errors(self):
+        """
+        Read the errors section of the source file once its data section is
+        complete, replacing the errors (nan) of the rows read by update().
+
+        Until the errors section is written up to its end_errors marker, the
+        errors stay nan (missing) and the section is looked for again on the
+        next call.
+
+        Parameters
+        ----------
+
+        Returns
+        -------
+        read: bool
+            True if the errors section has been read.
+        """
+
+        source = self._data_source
+        if source is None or source["errors_read"]:
+            return True
+        if not source["complete"]:
+            return False
+
+        errors = []
+
+        def add_error_line(line, offset):
+            errors.append(line)
 
+        with open(source["file"], "rb") as f:
+            f.seek(source["errors_offset"])
+            for ins in read_sections(f, {"errors": add_error_line}):
+                if ins[0] == "end_errors":
+                    source["errors_read"] = True
+                    break
+
+        if source["errors_read"]:
+            header, values = decode_section(errors, nan_value=source["nan_value"])
+            self.errors = trace_matrix(values[1:], header[1:])
+
+        return source["errors_read"]
+
+    def follow(self, callback=None, interval=1.0, timeout=None):
+        """
+        Keep reading rows appended to the data section of the source file
+        (see update()) until its end_data marker is written.
+
+        Parameters
+        ----------
+        callback: callable or None
+            Passed to update().
+        interval: float
+            Time between reads of the file in seconds.
+        timeout: float or None
+            Time after which to stop following in seconds. No limit if None.
+
+        Returns
+        -------
+        n_rows: int
+            Number of rows added.
+        """
+
+        start = time.monotonic()
+        n_rows = self.update(callback=callback)
+        while not self.data_complete:
+            if timeout is not None and time.monotonic() - start > timeout:
+                break
+
+            time.sleep(interval)
+            n_rows += self.update(callback=callback)
+
+        return n_rows
+
+    def to_numpy(self):
         """
+        Get the data in the data report as a 2D numpy array.
 
-        array = np.zeros((len(self.data), len(self.series_values)))
+        Each compound is a row. The array is the storage of self.data, not a
+        copy.
 
-        for c, comp in enumerate(self.data):
-            array[c] = self.data[comp]
+        Parameters
+        ----------
+
+        Returns
+        -------
+        array: numpy array
+
+        """
 
-        return array
+        return self.data.array
 
     def rows_from_dict(self, dict_container):
         """
@@ -284,15 +1076,8 @@ class data_report:
         _: list
             A list of repeated entries.
         """
-        entries = []
-        repeat_entries = []
-        for d in self.data:
-            token = d.split(" ")[0]
-            if token in entries:
-                repeat_entries.append(token)
-            entries.append(token)
 
-        return list(set(repeat_entries))
+        return [*repeat_groups(self.data)]
 
     def remove_repeat_entries(self):
         """
@@ -306,23 +1091,7 @@ class data_report:
         None
         """
 
-        # deleting duplicate entries: taking the entry with the higher signal using the
-        # signal sum as a discriminant.
-        repeat_entries = self.find_repeat_data_entries()
-
-        for r in repeat_entries:
-            compare_keys = []
-            for d in self.data:
-                if r in d:
-                    compare_keys.append(d)
-
-            checkline = np.zeros(len(compare_keys))
-            for c, comp in enumerate(compare_keys):
-                checkline[c] = np.sum(self.data[comp])
-
-            i_min = np.argmin(checkline)
-
-            del self.data[compare_keys[i_min]]
+        clean_data_reports([self], remove_repeats=True)
 
     def remove_specific_entries(self, remove_list):
         """
@@ -337,8 +1106,7 @@ class data_report:
         -------
         None
         """
-        for r in remove_list:
-            del self.data[r]
+        self.data.remove(remove_list)
 
     def remove_entries_below_threshold(self, threshold):
         """
@@ -354,10 +1122,4 @@ class data_report:
         None
         """
 
-        # remove entries whose concentrations/integrals do not cross a defined boundary
-        del_list = []
-        for d in self.data:
-            if np.amax(self.data[d]) < threshold:
-                del_list.append(d)
-
-        self.remove_specific_entries(del_list)
+        clean_data_reports([self], threshold=threshold, remove_repeats=False)
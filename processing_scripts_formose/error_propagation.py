@@ -0,0 +1,237 @@
+"""
+Propagation of the measurement errors in the errors section of the data
+reports through the averages, relative differences and normalized shifts.
+
+The errors of the timepoints are taken as independent standard deviations.
+Missing errors (nan, e.g. for data reports without an errors section) are
+taken as zero. As in the analysis, zero values (non-detects) are left out of
+the averages of the relative differences, and keep their value.
+"""
+
+import numpy as np
+
+from processing_scripts_formose.data_analysis_functions import (
+    nonzero_means,
+    normalized_shifts,
+    relative_difference,
+)
+from processing_scripts_formose.online_statistics import running_statistics
+
+
+def average_errors(traces, errors, nonzero=False):
+    """
+    Propagate the errors of the timepoints to the averages of the traces.
+
+    Parameters
+    ----------
+    traces: numpy array
+        Traces along the last axis, e.g. an experiment x compound x time
+        array. Missing values (nan) are left out.
+    errors: numpy array
+        Standard deviations with the shape of traces.
+    nonzero: bool
+        Propagate to the averages of the non-zero values (see
+        data_analysis_functions.nonzero_means).
+
+    Returns
+    -------
+    average_errors: numpy array
+        With the shape of traces without the time axis.
+    """
+
+    traces = np.asarray(traces, dtype=float)
+    mask = ~np.isnan(traces)
+    if nonzero:
+        mask &= traces != 0
+
+    variance = np.where(mask, np.nan_to_num(errors) ** 2, 0.0).sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.sqrt(variance) / mask.sum(axis=-1)
+
+
+def shift_errors(traces, errors, present, pairs):
+    """
+    Propagate the errors of the timepoints to the relative differences
+    between reference and perturbed experiments (see
+    data_analysis_functions.relative_shifts), to first order.
+
+    Parameters
+    ----------
+    traces: numpy array
+        Experiment x compound x time array, e.g. from
+        experiment_store.compound_traces.
+    errors: numpy array
+        Standard deviations with the shape of traces, e.g. from
+        experiment_store.compound_errors.
+    present: numpy array
+        Experiment x compound boolean array.
+    pairs: list[tuple(int, int)]
+        Experiment indices of the reference and perturbed experiments.
+
+    Returns
+    -------
+    shifts, shift_errors: numpy arrays
+        Pair x compound arrays. Shifts that are 0 by definition (e.g. absent
+        compounds) have no error, infinite shifts have an undefined (nan)
+        error.
+    """
+
+    pairs = np.asarray(pairs, dtype=int).reshape(-1, 2)
+    reference, perturbed = pairs[:, 0], pairs[:, 1]
+
+    means = nonzero_means(traces)
+    sigma = average_errors(traces, errors, nonzero=True)
+
+    shifts = relative_difference(
+        means[reference], means[perturbed], present[reference], present[perturbed]
+    )
+
+    mean_1 = np.where(present[reference], means[reference], 0.0)
+    mean_2 = means[perturbed]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma = np.abs(mean_2 / mean_1) * np.sqrt(
+            (sigma[perturbed] / mean_2) ** 2 + (sigma[reference] / mean_1) ** 2
+        )
+
+    sigma = np.where((shifts == 0) & np.isnan(sigma), 0.0, sigma)
+    sigma = np.where(np.isinf(shifts), np.nan, sigma)
+
+    return shifts, sigma
+
+
+def normalized_shift_errors(shifts, shift_errors, axis=0):
+    """
+    Propagate the errors of relative differences to the normalized shifts
+    (see data_analysis_functions.normalized_shifts), to first order.
+
+    The normalization by the largest finite absolute shift is included, so
+    the largest shift itself (normalized to -1 or 1) has no error.
+
+    Parameters
+    ----------
+    shifts, shift_errors: numpy arrays
+        Compounds along the last axis.
+    axis: int
+        Axis over which the largest shift is found.
+
+    Returns
+    -------
+    normalized_errors: numpy array
+        With the shape of shifts.
+    """
+
+    shifts = np.asarray(shifts, dtype=float)
+    finite = np.where(np.isinf(shifts), 0.0, shifts)
+
+    largest = np.argmax(np.abs(finite), axis=axis)
+    largest = np.expand_dims(largest, axis)
+    l_max = np.abs(np.take_along_axis(finite, largest, axis=axis))
+    l_sigma = np.take_along_axis(np.asarray(shift_errors), largest, axis=axis)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sigma = np.sqrt(
+            (shift_errors / l_max) ** 2 + (finite * l_sigma / l_max**2) ** 2
+        )
+
+    position = np.arange(shifts.shape[axis]).reshape(
+        [-1 if a == axis % shifts.ndim else 1 for a in range(shifts.ndim)]
+    )
+    sigma = np.where(position == largest, 0.0, sigma)
+
+    return np.where(np.isinf(shifts), 0.0, sigma)
+
+
+def monte_carlo_errors(
+    traces, errors, present, pairs, n_draws=1000, chunk_size=32, seed=0
+):
+    """
+    Propagate the errors of the timepoints to the averages, relative
+    differences and normalized shifts by Monte Carlo sampling.
+
+    All compounds and timepoints of a chunk of draws are sampled as one
+    array, and the results are accumulated chunk by chunk with
+    online_statistics.running_statistics, so the memory use is bounded by
+    chunk_size.
+
+    Parameters
+    ----------
+    traces: numpy array
+        Experiment x compound x time array, e.g. from
+        experiment_store.compound_traces.
+    errors: numpy array
+        Standard deviations with the shape of traces.
+    present: numpy array
+        Experiment x compound boolean array.
+    pairs: list[tuple(int, int)]
+        Experiment indices of the reference and perturbed experiments. The
+        shifts are normalized over the pairs.
+    n_draws: int
+    chunk_size: int
+        Number of draws sampled at once.
+    seed: int or None
+
+    Returns
+    -------
+    propagated: dict
+        "averages": (mean, std) of the averages, experiment x compound arrays
+        "shifts": (mean, std) of the relative differences, pair x compound
+        arrays
+        "normalized": (mean, std) of the normalized shifts, pair x compound
+        arrays
+    """
+
+    traces = np.asarray(traces, dtype=float)
+    pairs = np.asarray(pairs, dtype=int).reshape(-1, 2)
+    rng = np.random.default_rng(seed)
+
+    valid = ~np.isnan(traces)
+    # zero values are non-detects and are not perturbed, so the draws have
+    # the same non-zero values as the traces
+    nonzero = valid & (traces != 0)
+    counts = valid.sum(axis=-1)
+    nonzero_counts = nonzero.sum(axis=-1)
+
+    sigma = np.where(nonzero, np.nan_to_num(errors), 0.0)
+    values = np.nan_to_num(traces)
+
+    n_experiments, n_compounds = traces.shape[:2]
+    accumulators = {
+        "averages": running_statistics(range(n_experiments * n_compounds)),
+        "shifts": running_statistics(range(len(pairs) * n_compounds)),
+        "normalized": running_statistics(range(len(pairs) * n_compounds)),
+    }
+
+    for start in range(0, n_draws, chunk_size):
+        n = min(chunk_size, n_draws - start)
+        # missing values and non-detects are zero in the draws
+        draws = values + sigma * rng.standard_normal((n,) + traces.shape)
+        totals = draws.sum(axis=-1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            averages = totals / counts
+            means = totals / nonzero_counts
+        shifts = relative_difference(
+            means[:, pairs[:, 0]],
+            means[:, pairs[:, 1]],
+            present[pairs[:, 0]],
+            present[pairs[:, 1]],
+        )
+        normalized = normalized_shifts(shifts, axis=1)
+
+        for key, result in (
+            ("averages", averages),
+            ("shifts", shifts),
+            ("normalized", normalized),
+        ):
+            accumulators[key].update(result.reshape(n, -1).T)
+
+    propagated = dict()
+    for key, accumulator in accumulators.items():
+        statistics = accumulator.snapshot()
+        shape = (n_experiments if key == "averages" else len(pairs), n_compounds)
+        propagated[key] = (
+            statistics["mean"].reshape(shape),
+            statistics["std"].reshape(shape),
+        )
+
+    return propagated
@@ -0,0 +1,424 @@
+"""
+Store for the data of all of the experiments in the experiment catalog.
+"""
+
+import numpy as np
+from pathlib import Path
+
+from processing_scripts_formose import config_file, data_cache
+from processing_scripts_formose.data_report import (
+    clean_data_reports,
+    compound_index,
+    repeat_groups,
+)
+
+
+def parse_metadata_value(value):
+    """
+    Parse a catalog entry into a float if possible.
+
+    Parameters
+    ----------
+    value: str, int or float
+
+    Returns
+    -------
+    parsed: float or str
+    """
+
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def data_file(data_folder, experiment_code):
+    """
+    Get the path to the data report of an experiment.
+
+    Parameters
+    ----------
+    data_folder: pathlib Path or str
+        Folder containing the experiment folders.
+    experiment_code: str
+
+    Returns
+    -------
+    path: pathlib Path
+    """
+
+    folder = Path(data_folder) / experiment_code / "Analysed_data"
+
+    return folder / f"{experiment_code}_Data.csv"
+
+
+def load_experiments(codes, data_folder, workers=1, use_cache=True):
+    """
+    Load the data reports of a list of experiments, parsing them in parallel
+    (see data_cache.load_data_reports).
+
+    Parameters
+    ----------
+    codes: list[str]
+        Experiment codes.
+    data_folder: pathlib Path or str
+        Folder containing the experiment folders.
+    workers: int or None
+        Number of worker processes, 1 runs in this process. None uses
+        all available cores.
+    use_cache: bool
+        Load the data reports through the binary cache.
+
+    Returns
+    -------
+    reports: dict
+        Data reports keyed by experiment code.
+    """
+
+    files = [data_file(data_folder, c) for c in codes]
+    reports = data_cache.load_data_reports(files, workers=workers, use_cache=use_cache)
+
+    return dict(zip(codes, reports))
+
+
+class experiment_store:
+    """
+    A class for storing the data reports of the experiments in the experiment
+    catalog, indexed by their metadata.
+
+    The compound traces of all experiments are aligned in a ragged
+    experiment x compound x time array (traces), padded with nan where an
+    experiment has fewer timepoints (see lengths) or lacks a compound (see
+    present).
+    """
+
+    def __init__(
+        self,
+        catalog_file,
+        data_folder,
+        experiments=None,
+        use_cache=True,
+        workers=1,
+        clean=True,
+    ):
+        """
+        catalog_file: pathlib Path or str
+            Path to the experiment catalog, e.g. info_files/list_exp.csv.
+        data_folder: pathlib Path or str
+            Folder containing the experiment folders.
+        experiments: list[str] or None
+            Experiment codes to load. All experiments in the catalog are loaded
+            if None.
+        use_cache: bool
+            Load the data reports through the binary cache (see data_cache).
+        workers: int or None
+            Number of processes used to parse data reports whose cache is
+            stale, 1 parses them in this process. None uses all available
+            cores.
+        clean: bool
+            Remove repeated compound entries from the data reports (see
+            data_report.clean_data_reports) before the traces are aligned.
+            The traces can only be aligned without repeated entries.
+        """
+        header, rows = config_file.load_catalog(catalog_file)
+        if experiments is not None:
+            rows = [r for r in rows if r[0] in experiments]
+
+        self.columns = header[1:]
+        self.codes = [r[0] for r in rows]
+        self.experiment_rows = {code: c for c, code in enumerate(self.codes)}
+
+        # metadata columns and an index of their values. Multiple values in an
+        # entry are separated by ';', they are indexed separately and are nan
+        # in numerical columns.
+        self.catalog = dict()
+        self.metadata = dict()
+        self.metadata_index = dict()
+        for c, column in enumerate(self.columns, 1):
+            self.catalog[column] = [r[c] for r in rows]
+
+            entries = []
+            for r in rows:
+                entries.append([parse_metadata_value(v) for v in r[c].split(";")])
+
+            if all(type(v) == float for e in entries for v in e):
+                values = [e[0] if len(e) == 1 else np.nan for e in entries]
+                self.metadata[column] = np.array(values)
+            else:
+                self.metadata[column] = np.array(self.catalog[column], dtype=object)
+
+            index = dict()
+            for row, values in enumerate(entries):
+                for v in values:
+                    index.setdefault(v, []).append(row)
+            self.metadata_index[column] = {v: np.array(index[v]) for v in index}
+
+        self.reports = load_experiments(
+            self.codes, data_folder, workers=workers, use_cache=use_cache
+        )
+
+        if clean:
+            repeats = [r for r in self.reports.values() if repeat_groups(r.data)]
+            if len(repeats) > 0:
+                clean_data_reports(repeats, remove_repeats=True)
+
+        self.build_traces()
+
+    def build_traces(self):
+        """
+        Align the traces of the data reports into the experiment x compound x
+        time arrays.
+
+        The data reports must not contain repeated compound entries (see
+        data_report.clean_data_reports).
+
+        Parameters
+        ----------
+
+        Returns
+        -------
+        None
+        """
+
+        indices = []
+        for code in self.codes:
+            try:
+                indices.append(compound_index(self.reports[code].data))
+            except ValueError as error:
+                raise ValueError(
+                    f"The data report of {code} contains repeated compound "
+                    "entries, which have to be removed before the traces are "
+                    "aligned (use clean=True or "
+                    f"data_report.clean_data_reports): {error}"
+                ) from error
+
+        self.compounds = []
+        self.compound_rows = dict()
+        for index in indices:
+            for token in index:
+                if token not in self.compound_rows:
+                    self.compound_rows[token] = len(self.compounds)
+                    self.compounds.append(token)
+
+        self.lengths = np.array(
+            [len(self.reports[c].series_values) for c in self.codes], dtype=int
+        )
+
+        n_points = max(self.lengths, default=0)
+        shape = (len(self.codes), len(self.compounds), n_points)
+
+        self.traces = np.full(shape, np.nan)
+        self.errors = np.full(shape, np.nan)
+        self.series_values = np.full((len(self.codes), n_points), np.nan)
+        self.present = np.zeros(shape[:2], dtype=bool)
+
+        for e, code in enumerate(self.codes):
+            report = self.reports[code]
+            index = indices[e]
+            n = self.lengths[e]
+
+            rows = np.array([self.compound_rows[t] for t in index], dtype=int)
+            data_rows = [report.data.index[index[t]] for t in index]
+
+            self.traces[e, rows, :n] = report.data.array[data_rows]
+            if all(index[t] in report.errors for t in index):
+                error_rows = [report.errors.index[index[t]] for t in index]
+                self.errors[e, rows, :n] = report.errors.array[error_rows]
+
+            self.series_values[e, :n] = report.series_values
+            self.present[e, rows] = True
+
+    def column(self, key):
+        """
+        Find a metadata column from its full name (e.g. "conc_HCHO/ mM") or
+        the part of its name before the unit (e.g. "conc_HCHO").
+
+        Parameters
+        ----------
+        key: str
+
+        Returns
+        -------
+        column: str
+        """
+
+        if key in self.metadata:
+            return key
+
+        for column in self.columns:
+            if column.split("/")[0] == key:
+                return column
+
+        raise KeyError(f"{key} is not a column of the experiment catalog.")
+
+    def select_rows(self, **criteria):
+        """
+        Find the experiments whose metadata match all of the criteria, using
+        the metadata index.
+
+        Parameters
+        ----------
+        criteria:
+            Column (see column()) and value, or list of accepted values, e.g.
+            conc_HCHO=50 or set=["20_mM_amp", "50_mM_amp"].
+
+        Returns
+        -------
+        rows: numpy array
+            Experiment rows in catalog order.
+        """
+
+        rows = np.arange(len(self.codes))
+        for key, value in criteria.items():
+            index = self.metadata_index[self.column(key)]
+            if not isinstance(value, (list, tuple, set)):
+                value = [value]
+
+            value = [parse_metadata_value(v) for v in value]
+            matches = [index[v] for v in value if v in index]
+            if len(matches) == 0:
+                return np.array([], dtype=int)
+
+            rows = np.intersect1d(rows, np.concatenate(matches))
+
+        return rows
+
+    def select(self, order_by=[], **criteria):
+        """
+        Find the codes of the experiments whose metadata match all of the
+        criteria (see select_rows).
+
+        Parameters
+        ----------
+        order_by: list[str]
+            Columns by which the experiments are sorted. Catalog order if
+            empty.
+        criteria:
+            Column and value, or list of accepted values.
+
+        Returns
+        -------
+        codes: list[str]
+        """
+
+        rows = self.select_rows(**criteria)
+        if len(order_by) > 0:
+            keys = [self.metadata[self.column(c)][rows] for c in order_by]
+            rows = rows[np.lexsort(keys[::-1])]
+
+        return [self.codes[r] for r in rows]
+
+    def traces_of(self, codes):
+        """
+        Get the experiment x compound x time traces of a list of experiments.
+
+        Parameters
+        ----------
+        codes: list[str]
+
+        Returns
+        -------
+        traces: numpy array
+        """
+
+        return self.traces[[self.experiment_rows[c] for c in codes]]
+
+    def _compound_rows(self, array, compounds, codes):
+        """
+        Select experiments and compounds from an experiment x compound x time
+        array of the store, with nan rows for compounds that are not found.
+        """
+
+        if codes is None:
+            codes = self.codes
+        experiments = [self.experiment_rows[c] for c in codes]
+
+        found = [k for k, c in enumerate(compounds) if c in self.compound_rows]
+        rows = [self.compound_rows[compounds[k]] for k in found]
+
+        selected = np.full((len(experiments), len(compounds)) + array.shape[2:], np.nan)
+        selected[:, found] = array[np.ix_(experiments, rows)]
+
+        return selected
+
+    def compound_traces(self, compounds, codes=None):
+        """
+        Get the traces of a list of compounds, including compounds that are
+        not found in any experiment.
+
+        Parameters
+        ----------
+        compounds: list[str]
+            Compound tokens (SMILES).
+        codes: list[str] or None
+            Experiment codes. All experiments if None.
+
+        Returns
+        -------
+        traces: numpy array
+            Experiment x compound x time array, nan where a compound is absent.
+        present: numpy array
+            Experiment x compound boolean array.
+        """
+
+        traces = self._compound_rows(self.traces, compounds, codes)
+        present = self._compound_rows(self.present, compounds, codes) == 1
+
+        return traces, present
+
+    def compound_errors(self, compounds, codes=None):
+        """
+        Get the measurement errors of the traces of a list of compounds (see
+        compound_traces).
+
+        Parameters
+        ----------
+        compounds: list[str]
+            Compound tokens (SMILES).
+        codes: list[str] or None
+            Experiment codes. All experiments if None.
+
+        Returns
+        -------
+        errors: numpy array
+            Experiment x compound x time array, nan where a compound is absent
+            or a data report has no errors for it.
+        """
+
+        return self._compound_rows(self.errors, compounds, codes)
+
+    def reference_pairs(self, reference, group="set", groups=None, order_by=[]):
+        """
+        Pair the experiments of each group (e.g. each set) with the reference
+        experiment of the group, e.g. the unperturbed steady state.
+
+        Parameters
+        ----------
+        reference: dict
+            Criteria of the reference experiments (see select_rows), e.g.
+            {"std_Ca(OH)2": 0}.
+        group: str
+            Column by which the experiments are grouped.
+        groups: list or None
+            Values of group to pair, in this order. All values in catalog order
+            if None. Groups without a reference experiment are left out.
+        order_by: list[str]
+            Columns by which the perturbed experiments of a group are sorted.
+
+        Returns
+        -------
+        pairs: list[tuple(str, str)]
+            (reference code, perturbed code) tuples.
+        """
+
+        if groups is None:
+            groups = [*self.metadata_index[self.column(group)]]
+
+        pairs = []
+        for value in groups:
+            members = self.select(order_by=order_by, **{group: value})
+            references = self.select(**{group: value}, **reference)
+            for r in references:
+                pairs.extend((r, p) for p in members if p not in references)
+
+        return pairs
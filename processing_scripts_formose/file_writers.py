@@ -1,4 +1,6 @@
-def write_average_stdev_csv(averages, st_devs, comp_ind, filename=""):
+def write_average_stdev_csv(
+    averages, st_devs, comp_ind, filename="", confidence_intervals=None
+):
     """
     Write averages and standard deviation dicts to a .csv file.
 
@@ -7,19 +9,29 @@ def write_average_stdev_csv(averages, st_devs, comp_ind, filename=""):
     averages: dict()
     st_devs: dict()
     filename: str or pathlib.Path
+    confidence_intervals: dict() or None
+        Lower and upper bounds of the confidence intervals of the averages,
+        written as two extra columns if given.
 
     Returns
     -------
     None
     """
 
-    data_string = "index,compound,average/ M,standard deviation/ M\n"
+    data_string = "index,compound,average/ M,standard deviation/ M"
+    if confidence_intervals is not None:
+        data_string += ",CI lower/ M,CI upper/ M"
+    data_string += "\n"
 
     for compound in averages:
         compound_token = compound.split("/")[0]
         ind = str(comp_ind[compound_token])
         data_string += f"{ind},{compound_token},{averages[compound]},"
-        data_string += f"{st_devs[compound]}\n"
+        data_string += f"{st_devs[compound]}"
+        if confidence_intervals is not None:
+            lower, upper = confidence_intervals[compound]
+            data_string += f",{lower},{upper}"
+        data_string += "\n"
 
     with open(filename, "w") as file:
         file.write(data_string)
@@ -50,6 +62,85 @@ def write_corr_csv(corr, t_interval, ind, filename=""):
     print("Results written to output file: ", f"{filename}")
 
 
+def write_corr_p_values_csv(p_values, t_interval, ind, filename=""):
+    """
+    Write the p-values of the correlations to a .csv file, in the layout of
+    write_corr_csv.
+
+    Parameters
+    ----------
+    p_values: numpy array
+        Interval x compound array (see resampling.correlation_p_values).
+    t_interval: list
+    ind: list
+        Compound indices.
+    filename: str or pathlib.Path
+
+    Returns
+    -------
+    None
+    """
+
+    data_string = "compound_ind,"
+    for n in ind:
+        data_string += f"{n},"
+    data_string += f"\n"
+
+    for a, x in enumerate(p_values):
+        data_string += f"{t_interval[a]}_s_p_value,"
+        for y in x:
+            data_string += f"{y},"
+        data_string += f"\n"
+
+    with open(filename, "w") as file:
+        file.write(data_string)
+    print("Results written to output file: ", f"{filename}")
+
+
+def write_lagged_corr_csv(peak_r, peak_lag, t_interval, ind, filename=""):
+    """
+    Write the peak correlations of the lagged correlation analysis and their
+    lags to a .csv file, in the layout of write_corr_csv.
+
+    Parameters
+    ----------
+    peak_r: numpy array
+        Interval x compound array (see
+        data_analysis_functions.lagged_correlations).
+    peak_lag: numpy array
+        Interval x compound array of lags in s.
+    t_interval: list
+    ind: list
+        Compound indices.
+    filename: str or pathlib.Path
+
+    Returns
+    -------
+    None
+    """
+
+    data_string = "compound_ind,"
+    for n in ind:
+        data_string += f"{n},"
+    data_string += f"\n"
+
+    for a, x in enumerate(peak_r):
+        data_string += f"{t_interval[a]}_s_peak_r,"
+        for y in x:
+            data_string += f"{y},"
+        data_string += f"\n"
+
+    for a, x in enumerate(peak_lag):
+        data_string += f"{t_interval[a]}_s_peak_lag/ s,"
+        for y in x:
+            data_string += f"{y},"
+        data_string += f"\n"
+
+    with open(filename, "w") as file:
+        file.write(data_string)
+    print("Results written to output file: ", f"{filename}")
+
+
 def write_rel_diff_csv(dic_rel_diff, exp, filename=""):
     """
     Write relative difference in concentration dicts to a .csv file.
@@ -78,3 +169,75 @@ def write_rel_diff_csv(dic_rel_diff, exp, filename=""):
     with open(filename, "w") as file:
         file.write(data_string)
     print("Results written to output file: ", f"{filename}")
+
+
+def write_rel_diff_ci_csv(lower, upper, compounds, exp, filename=""):
+    """
+    Write the confidence intervals of relative differences in concentration
+    to a .csv file, with a lower and upper column per experiment.
+
+    Parameters
+    ----------
+    lower, upper: numpy arrays
+        Experiment x compound arrays.
+    compounds: list
+        Compound indices.
+    exp: list[str]
+        Experiment codes.
+    filename: str or pathlib.Path
+
+    Returns
+    -------
+    None
+    """
+    data_string = "compound,"
+
+    for x in exp:
+        data_string += f"{x}_CI_lower,{x}_CI_upper,"
+    data_string += f"\n"
+
+    for c, compound in enumerate(compounds):
+        data_string += f"{compound},"
+        for l, u in zip(lower[:, c], upper[:, c]):
+            data_string += f"{l},{u},"
+        data_string += f"\n"
+
+    with open(filename, "w") as file:
+        file.write(data_string)
+    print("Results written to output file: ", f"{filename}")
+
+
+def write_cluster_support_csv(Z, support, labels, filename=""):
+    """
+    Write the support values of the nodes of a dendrogram to a .csv file,
+    one row per row of the linkage matrix.
+
+    Parameters
+    ----------
+    Z: numpy array
+        Linkage matrix.
+    support: dict
+        "au" and "bp" values per row of Z, e.g. from
+        clustering.multiscale_bootstrap.
+    labels: list
+        Leaf labels.
+    filename: str or pathlib.Path
+
+    Returns
+    -------
+    None
+    """
+    data_string = "node,height,AU,BP,members\n"
+
+    n = len(Z) + 1
+    members = [[l] for l in labels]
+    for node, (a, b) in enumerate(Z[:, :2].astype(int)):
+        members.append(members[a] + members[b])
+        data_string += f"{n + node},{Z[node, 2]},"
+        data_string += f"{support['au'][node]},{support['bp'][node]},"
+        data_string += " ".join(str(m) for m in members[-1])
+        data_string += "\n"
+
+    with open(filename, "w") as file:
+        file.write(data_string)
+    print("Results written to output file: ", f"{filename}")
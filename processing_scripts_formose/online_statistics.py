@@ -0,0 +1,313 @@
+"""
+Online statistics for experiments that are still acquiring data.
+
+The accumulators are updated with each new timepoint (or chunk of
+timepoints), e.g. from the callback of data_report.update(), instead of
+recalculating the statistics from the complete traces. Partial results of
+separate partitions of the data can be merged (Chan et al.).
+"""
+
+import copy
+import numpy as np
+
+from processing_scripts_formose.data_report import trace_matrix
+
+
+class running_statistics:
+    """
+    Running count, mean and variance of compound traces and, optionally,
+    their covariance with a flow trace.
+
+    Updates are combined with the pairwise algorithm of Chan et al.: a chunk
+    of timepoints is reduced on its own and then merged into the running
+    moments, which reduces to Welford's algorithm for single timepoints. The
+    traces must not contain missing values (nan).
+    """
+
+    def __init__(self, names=[], flow_condition=None):
+        """
+        names: list[str]
+            Names of the compound rows, e.g. the keys of data_report.data.
+        flow_condition: str or None
+            Condition of a data report with the flow profile, e.g.
+            "NaOH_flow/ µl/h", used when the object is called as the callback
+            of data_report.update().
+        """
+        self.names = list(names)
+        self.flow_condition = flow_condition
+
+        self.count = 0
+        self.mean = np.zeros(len(self.names))
+        self.m2 = np.zeros(len(self.names))
+
+        # moments of the flow and co-moments of the compounds with the flow,
+        # None until the first update with a flow
+        self.flow_mean = None
+        self.flow_m2 = None
+        self.comoment = None
+
+    @property
+    def with_flow(self):
+        """
+        True if the flow is accumulated.
+        """
+        return self.flow_mean is not None
+
+    def _combine(self, count, mean, m2, flow=None):
+        """
+        Merge the moments of a partition into the running moments.
+
+        Parameters
+        ----------
+        count: int
+        mean, m2: numpy arrays
+            Mean and sum of squared deviations per compound.
+        flow: tuple or None
+            Mean and sum of squared deviations of the flow and co-moments per
+            compound.
+
+        Returns
+        -------
+        None
+        """
+
+        if count == 0:
+            return
+
+        if self.count == 0:
+            self.count = count
+            self.mean = np.array(mean, dtype=float)
+            self.m2 = np.array(m2, dtype=float)
+            if flow is not None:
+                self.flow_mean, self.flow_m2, self.comoment = copy.deepcopy(flow)
+            return
+
+        if (flow is not None) != self.with_flow:
+            raise ValueError("The flow must be given for all or none of the updates.")
+
+        total = self.count + count
+        weight = self.count * count / total
+
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta**2 * weight
+
+        if flow is not None:
+            flow_mean, flow_m2, comoment = flow
+            flow_delta = flow_mean - self.flow_mean
+            self.flow_mean = self.flow_mean + flow_delta * count / total
+            self.flow_m2 = self.flow_m2 + flow_m2 + flow_delta**2 * weight
+            self.comoment = self.comoment + comoment + delta * flow_delta * weight
+
+        self.count = total
+
+    def update(self, values, flow=None):
+        """
+        Add timepoints to the statistics.
+
+        Parameters
+        ----------
+        values: numpy array
+            Compound x time array of new timepoints, or a 1D array with one
+            value per compound for a single timepoint.
+        flow: numpy array, float or None
+            Flow at the new timepoints.
+
+        Returns
+        -------
+        None
+        """
+
+        values = np.asarray(values, dtype=float).reshape(len(self.mean), -1)
+        count = values.shape[1]
+        if count == 0:
+            return
+
+        mean = values.mean(axis=1)
+        deviations = values - mean[:, np.newaxis]
+        m2 = np.einsum("ij,ij->i", deviations, deviations)
+
+        if flow is not None:
+            flow = np.asarray(flow, dtype=float).reshape(count)
+            flow_mean = flow.mean()
+            flow_deviations = flow - flow_mean
+            flow = (
+                flow_mean,
+                flow_deviations @ flow_deviations,
+                deviations @ flow_deviations,
+            )
+
+        self._combine(count, mean, m2, flow)
+
+    def merge(self, other):
+        """
+        Merge the statistics of another partition of the timepoints, e.g.
+        from a separate process.
+
+        Parameters
+        ----------
+        other: running_statistics
+            Statistics of the same compounds.
+
+        Returns
+        -------
+        self: running_statistics
+        """
+
+        if other.names != self.names:
+            raise ValueError("Statistics of different compounds can not be merged.")
+
+        flow = None
+        if other.with_flow:
+            flow = (other.flow_mean, other.flow_m2, other.comoment)
+
+        self._combine(other.count, other.mean, other.m2, flow)
+
+        return self
+
+    def copy(self):
+        """
+        Create an independent copy of the statistics.
+
+        Returns
+        -------
+        statistics: running_statistics
+        """
+
+        return copy.deepcopy(self)
+
+    def snapshot(self):
+        """
+        Get the current statistics.
+
+        Parameters
+        ----------
+
+        Returns
+        -------
+        statistics: dict
+            "compounds": names of the compounds (None if not given)
+            "count": number of timepoints
+            "mean", "variance" (ddof=1), "std" (ddof=1): arrays with one entry
+            per compound
+            "flow_mean", "flow_variance", "covariance" (ddof=1) and
+            "correlation" (Pearson) with the flow, if the flow is accumulated
+        """
+
+        statistics = {"compounds": list(self.names) if self.names else None}
+        statistics["count"] = self.count
+
+        # the variances are undefined for fewer than two timepoints
+        ddof_count = self.count - 1 if self.count > 1 else np.nan
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.count > 0:
+                statistics["mean"] = self.mean.copy()
+            else:
+                statistics["mean"] = np.full(len(self.mean), np.nan)
+            statistics["variance"] = self.m2 / ddof_count
+            statistics["std"] = np.sqrt(statistics["variance"])
+
+            if self.with_flow:
+                statistics["flow_mean"] = self.flow_mean
+                statistics["flow_variance"] = self.flow_m2 / ddof_count
+                statistics["covariance"] = self.comoment / ddof_count
+                statistics["correlation"] = np.clip(
+                    self.comoment / np.sqrt(self.m2 * self.flow_m2), -1.0, 1.0
+                )
+
+        return statistics
+
+    def __call__(self, report, series_values, values):
+        """
+        Update the statistics with the rows read by data_report.update(),
+        with the flow at the new timepoints if flow_condition is set.
+        """
+        flow = None
+        if self.flow_condition is not None:
+            profile = report.conditions[self.flow_condition]
+            flow = np.asarray(profile)[np.asarray(series_values).astype(int)]
+
+        self.update(values, flow=flow)
+
+
+class running_differentials:
+    """
+    Differences between the means of consecutive windows of time intervals
+    (see data_analysis_functions.differential_means), extended as new
+    timepoints arrive.
+
+    The differentials are not normalized, which leaves their correlations
+    unchanged, so running_statistics of the differentials give the
+    correlations of data_analysis_functions.correlation.
+    """
+
+    def __init__(self, t_interval, sample_time):
+        """
+        t_interval: 1D list
+            Time intervals, in the unit of sample_time.
+        sample_time: float
+            Time between samples.
+        """
+        self.intervals = [x / sample_time for x in t_interval]
+        self.n_points = 0
+
+        # cumulative sums of the traces relative to their first timepoint
+        self.origin = None
+        self.sums = None
+        # window means per time interval
+        self.lags = []
+
+    def update(self, values):
+        """
+        Add timepoints to the traces.
+
+        Parameters
+        ----------
+        values: numpy array
+            Compound x time array of new timepoints, or a 1D array with one
+            value per compound for a single timepoint.
+
+        Returns
+        -------
+        differentials: list[numpy array]
+            Per time interval, a compound x time array of the new
+            differentials.
+        """
+
+        if self.sums is None:
+            values = np.asarray(values, dtype=float)
+            n_rows = len(values)
+            names = [str(r) for r in range(n_rows)]
+
+            self.origin = values.reshape(n_rows, -1)[:, :1].copy()
+            self.sums = trace_matrix(np.zeros((n_rows, 1)), names)
+            self.lags = [
+                trace_matrix(np.zeros((n_rows, 0)), names) for _ in self.intervals
+            ]
+
+        values = np.asarray(values, dtype=float).reshape(len(self.origin), -1)
+        start = self.n_points
+        self.n_points += values.shape[1]
+
+        self.sums.extend(
+            np.cumsum(values - self.origin, axis=1) + self.sums.array[:, -1:]
+        )
+        sums = self.sums.array
+
+        differentials = []
+        for interval, lag in zip(self.intervals, self.lags):
+            ends = np.arange(start, self.n_points)
+            ends = ends[ends > interval - 1]
+            starts = np.trunc(ends - interval).astype(int)
+
+            n_lag = lag.array.shape[1]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                lag.extend((sums[:, ends] - sums[:, starts]) / (ends - starts))
+
+            ends = np.arange(n_lag, lag.array.shape[1])
+            ends = ends[ends > interval - 1]
+            starts = np.trunc(ends - interval).astype(int)
+            differentials.append(lag.array[:, ends] - lag.array[:, starts])
+
+        return differentials
@@ -0,0 +1,164 @@
+"""
+Manifest of the output files of the analysis scripts.
+
+The manifest records, per output file, a hash of the inputs it was created
+from (data, p-values, palette, labels, ...). Outputs whose inputs are
+unchanged since the last run, and which still exist, are not rendered or
+written again. The manifest is a JSON file in the output folder and can be
+deleted at any time; changes to the plotting or writing code itself are not
+detected, for which the outputs can be forced to be rewritten.
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = "output_manifest.json"
+
+
+def _update_hash(sha, value):
+    """
+    Add a value to a hash, recursing into containers.
+
+    Parameters
+    ----------
+    sha: hashlib hash object
+    value: object
+        numpy arrays, pandas data frames and series, dicts, lists, tuples
+        and values with a deterministic repr().
+
+    Returns
+    -------
+    None
+    """
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        sha.update(f"{type(value).__name__}:{list(value.index)!r}".encode())
+        if isinstance(value, pd.DataFrame):
+            sha.update(repr(list(value.columns)).encode())
+        value = value.to_numpy()
+
+    if isinstance(value, np.ndarray):
+        sha.update(f"ndarray:{value.dtype.str}:{value.shape}".encode())
+        if value.dtype == object:
+            _update_hash(sha, value.tolist())
+        else:
+            sha.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        sha.update(f"dict:{len(value)}".encode())
+        for k, v in value.items():
+            _update_hash(sha, k)
+            _update_hash(sha, v)
+    elif isinstance(value, (list, tuple)):
+        sha.update(f"{type(value).__name__}:{len(value)}".encode())
+        for v in value:
+            _update_hash(sha, v)
+    else:
+        sha.update(f"{type(value).__name__}:{value!r}".encode())
+
+
+def input_hash(*inputs):
+    """
+    Calculate the SHA-256 hash of the inputs of an output file.
+
+    Parameters
+    ----------
+    inputs: objects
+        See _update_hash.
+
+    Returns
+    -------
+    digest: str
+    """
+
+    sha = hashlib.sha256()
+    for value in inputs:
+        _update_hash(sha, value)
+
+    return sha.hexdigest()
+
+
+class output_manifest:
+    """
+    Input hashes of the output files in an output folder.
+    """
+
+    def __init__(self, output_folder, force=False):
+        """
+        output_folder: pathlib Path or str
+            Folder containing the manifest file.
+        force: bool
+            Treat all outputs as out of date, e.g. after changes to the
+            plotting code.
+        """
+        self.filename = Path(output_folder) / MANIFEST_FILE
+        self.force = force
+        self.entries = dict()
+
+        if self.filename.exists():
+            try:
+                with open(self.filename, "r") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = dict()
+
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.entries = manifest["outputs"]
+
+    def is_current(self, output, key):
+        """
+        Check whether an output file was created from the same inputs.
+
+        Parameters
+        ----------
+        output: pathlib Path or str
+            Path to the output file.
+        key: str
+            Hash of the inputs (see input_hash).
+
+        Returns
+        -------
+        current: bool
+        """
+
+        if self.force:
+            return False
+
+        return self.entries.get(str(output)) == key and os.path.exists(output)
+
+    def record(self, output, key):
+        """
+        Record the hash of the inputs of a written output file.
+
+        Parameters
+        ----------
+        output: pathlib Path or str
+        key: str
+
+        Returns
+        -------
+        None
+        """
+
+        self.entries[str(output)] = key
+
+    def save(self):
+        """
+        Write the manifest file.
+
+        Returns
+        -------
+        None
+        """
+
+        os.makedirs(self.filename.parent, exist_ok=True)
+        temp_file = self.filename.with_suffix(f".tmp{os.getpid()}")
+        with open(temp_file, "w") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "outputs": self.entries}, f, indent=1
+            )
+        os.replace(temp_file, self.filename)
@@ -0,0 +1,133 @@
+"""
+Process pools for the analysis functions.
+
+The worker processes are started with the default start method of the
+platform, so scripts using the pools keep their code in a main() function
+behind an if __name__ == "__main__" guard: spawned workers import the
+calling script. The functions run in this process unless more than one
+worker is requested.
+
+Large read-only inputs shared by all the jobs of a map_jobs call are sent to
+each worker once, when the pool starts, and read with shared_value.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# values shared by the jobs running in this process, see map_jobs
+_shared = {}
+
+
+def n_workers(workers=1):
+    """
+    Get the number of worker processes to use.
+
+    Parameters
+    ----------
+    workers: int or None
+        Requested number of workers. None uses all available cores.
+
+    Returns
+    -------
+    n: int
+    """
+
+    if workers is None:
+        if hasattr(os, "sched_getaffinity"):
+            workers = len(os.sched_getaffinity(0))
+        else:
+            workers = os.cpu_count() or 1
+
+    return max(1, int(workers))
+
+
+def set_shared(shared):
+    """
+    Replace the values shared by the jobs running in this process. Used as the
+    initializer of the worker processes.
+
+    Parameters
+    ----------
+    shared: dict
+    """
+
+    _shared.clear()
+    _shared.update(shared)
+
+
+def shared_value(name):
+    """
+    Get a value shared by the jobs of the running map_jobs call.
+
+    Parameters
+    ----------
+    name: str
+        Key of the value in the shared argument of map_jobs.
+
+    Returns
+    -------
+    value
+    """
+
+    return _shared[name]
+
+
+def process_pool(workers=1, shared=None):
+    """
+    Create a process pool.
+
+    Parameters
+    ----------
+    workers: int or None
+        Number of worker processes. None uses all available cores.
+    shared: dict or None
+        Values sent to each worker process once, when it starts, and read
+        with shared_value.
+
+    Returns
+    -------
+    pool: concurrent.futures.ProcessPoolExecutor
+    """
+
+    return ProcessPoolExecutor(
+        max_workers=n_workers(workers),
+        initializer=set_shared,
+        initargs=(shared or {},),
+    )
+
+
+def map_jobs(function, jobs, workers=1, shared=None):
+    """
+    Apply a function to a list of jobs, in parallel if more than one worker
+    is used.
+
+    Parameters
+    ----------
+    function: callable
+        Module-level function, so it can be sent to the worker processes.
+    jobs: list
+        Arguments for function, one per call.
+    workers: int or None
+        Number of worker processes, 1 runs the jobs in this process. None uses
+        all available cores.
+    shared: dict or None
+        Read-only values used by all the jobs, e.g. large arrays, which the
+        jobs get with shared_value instead of receiving a copy each.
+
+    Returns
+    -------
+    results: list
+        Results in the order of jobs.
+    """
+
+    workers = min(n_workers(workers), len(jobs))
+    if workers <= 1:
+        previous = dict(_shared)
+        set_shared(shared or {})
+        try:
+            return [function(j) for j in jobs]
+        finally:
+            set_shared(previous)
+
+    with process_pool(workers, shared) as pool:
+        return list(pool.map(function, jobs))
@@ -1,16 +1,18 @@
 import os
 import numpy as np
 import pandas as pd
-from scipy import stats
 
 import seaborn as sns
 import matplotlib as mpl
 import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
 
 from statannotations.Annotator import Annotator
 from scipy.cluster.hierarchy import dendrogram
 
+from processing_scripts_formose import output_manifest, parallel
+from processing_scripts_formose.data_report import compound_index
+from processing_scripts_formose.data_analysis_functions import correlation
+
 
 def colorFader(
     c1, c2, mix=0
@@ -22,7 +24,9 @@ def colorFader(
 
 def compound_wise_dataframes(data_report_list, data_names=[]):
     """
-    Create compound-wise data frames from the data_report_list.
+    Create compound-wise data frames from the data_report_list, padded with
+    nan to the longest trace (see long_form_dataframe for a table without
+    padding).
 
     Parameters
     ----------
@@ -77,6 +81,213 @@ def compound_wise_dataframes(data_report_list, data_names=[]):
     return data_frames
 
 
+def long_form_dataframe(data_report_list, data_names=[], scale=1.0):
+    """
+    Create one long-form data frame of the traces of all compounds in the
+    data_report_list, for compound-wise plots with seaborn.
+
+    The traces are concatenated in one step, ordered by compound (in order
+    of first appearance) and, within each compound, by data report, so the
+    rows of each compound are contiguous (see compound_groups).
+
+    Parameters
+    ----------
+    data_report_list: list[data_report.data_report]
+    data_names: list
+        Aliases for the data reports, the experiment codes if empty.
+    scale: float
+        Factor applied to the values, e.g. 1000 for mM.
+
+    Returns
+    -------
+    data_frame: pandas DataFrame
+        "compound" (categorical, the compound token), "series" (categorical,
+        in the order of data_names) and "value" columns.
+    """
+
+    if len(data_names) == 0:
+        data_names = [report.experiment_code for report in data_report_list]
+
+    names = []
+    series = []
+    values = []
+    for c, report in enumerate(data_report_list):
+        array = np.asarray(report.data.array)
+        names.extend(
+            np.repeat(
+                [compound.split("/")[0] for compound in report.data], array.shape[1]
+            )
+        )
+        series.append(np.full(array.size, c))
+        values.append(array.ravel())
+
+    codes, compounds = pd.factorize(np.asarray(names, dtype=object), sort=False)
+    order = np.argsort(codes, kind="stable")
+
+    return pd.DataFrame(
+        {
+            "compound": pd.Categorical.from_codes(codes[order], compounds),
+            "series": pd.Categorical.from_codes(
+                np.concatenate(series)[order], [str(x) for x in data_names]
+            ),
+            "value": np.concatenate(values)[order] * scale,
+        }
+    )
+
+
+def compound_groups(data_frame):
+    """
+    Split a long-form data frame (see long_form_dataframe) by compound.
+
+    Parameters
+    ----------
+    data_frame: pandas DataFrame
+
+    Returns
+    -------
+    groups: dict
+        Per compound, a slice of data_frame. The rows of each compound are
+        contiguous, so the slices are views rather than copies.
+    """
+
+    positions = data_frame.groupby("compound", observed=True, sort=False).indices
+
+    return {
+        compound: data_frame.iloc[rows[0] : rows[-1] + 1]
+        for compound, rows in positions.items()
+    }
+
+
+def violin_theme_rc():
+    """
+    Get the rcParams of the seaborn theme of the violin plots, without
+    changing the global rcParams.
+
+    Returns
+    -------
+    rc: dict
+    """
+    with mpl.rc_context():
+        sns.set_theme(font_scale=1.8, color_codes=False)
+        sns.set_style("ticks")
+        rc = dict(mpl.rcParams)
+
+    del rc["backend"]
+
+    return rc
+
+
+def annotate_pairs(ax, pair_names, p, data, **columns):
+    """
+    Annotate the p-values of pairs of violins with statannotations.
+
+    The annotator measures the annotations on the current pyplot figure
+    (plt.gcf()), so the Axes must belong to it.
+
+    Parameters
+    ----------
+    ax: matplotlib Axes
+    pair_names: list[tuple]
+    p: list[float]
+        p-values of the pairs.
+    data: pandas DataFrame
+    columns: keyword arguments
+        x, y and order of the plot.
+
+    Returns
+    -------
+    None
+    """
+
+    annotator = Annotator(ax, pair_names, data=data, **columns)
+    annotator.set_pvalues(p)
+    annotator.annotate()
+
+
+def render_violin_plot(job):
+    """
+    Draw the violin plot of one compound and save it as a .png file.
+
+    The figure is drawn with the theme of violin_theme_rc, so the global
+    rcParams are not changed, and closed when the job ends, so jobs can be
+    rendered one after the other in worker processes. Used by
+    create_series_violin_plots.
+
+    Parameters
+    ----------
+    job: tuple
+        Long-form data frame of the compound (in mM, see
+        long_form_dataframe), order of the series, palette, pairs of series,
+        p-values of the pairs, x label, title and output filename.
+
+    Returns
+    -------
+    None
+    """
+
+    df, order, palette, pair_names, p, x_label, title, output_filename = job
+    columns = {"x": "series", "y": "value", "order": order}
+
+    # the series are both the x and the hue variable; seaborn < 0.13 would
+    # scale each violin to its own maximum density instead of all together
+    scale = dict()
+    if tuple(int(v) for v in sns.__version__.split(".")[:2]) < (0, 13):
+        scale["scale_hue"] = False
+
+    with plt.rc_context(violin_theme_rc()):
+        fig = plt.figure(figsize=(6.5, 4.5), frameon=True)
+        try:
+            ax = fig.subplots()
+
+            sns.violinplot(
+                data=df,
+                **columns,
+                hue="series",
+                hue_order=order,
+                dodge=False,
+                width=1,
+                **scale,
+                palette=palette,
+                inner="box",
+                saturation=0.3,
+                ax=ax,
+            )
+
+            sns.boxplot(
+                data=df,
+                **columns,
+                hue="series",
+                hue_order=order,
+                dodge=False,
+                width=0.1,
+                palette=palette,
+                boxprops={"zorder": 2},
+                ax=ax,
+            )
+
+            # the series are on the x axis, the legend of the hue is redundant
+            if ax.get_legend() is not None:
+                ax.get_legend().remove()
+
+            annotate_pairs(ax, pair_names, p, df, **columns)
+
+            for label in ax.get_xticklabels():
+                label.set(rotation=0, fontweight="bold", fontsize=20)
+            for label in ax.get_yticklabels():
+                label.set(fontsize=23)
+
+            ax.set_xlabel(x_label, fontweight="bold", fontsize=23)
+            ax.set_ylabel("concentration/ mM", fontsize=23, fontweight="bold")
+            ax.set_title(title, fontsize=20, fontweight="bold")
+
+            fig.tight_layout()
+            fig.savefig(output_filename)
+        finally:
+            plt.close(fig)
+
+    print(f"Plot written to {output_filename}")
+
+
 def create_series_violin_plots(
     data_report_list,
     compound_colours={},
@@ -87,14 +298,27 @@ def create_series_violin_plots(
     p_values=[],
     names={},
     index={},
+    workers=1,
+    manifest=None,
 ):
     """
     Create violin plots of a series of data reports.
 
+    The plots of the compounds are rendered in parallel (see
+    render_violin_plot). The data reports, and the p-values calculated from
+    them, must not contain repeated compound entries (see
+    data_report.clean_data_reports).
+
     Parameters
     ----------
     data_report_list: list[data_report.data_report]
     filename: str or pathlib.Path
+    workers: int or None
+        Number of worker processes, 1 runs in this process. None uses
+        all available cores.
+    manifest: output_manifest.output_manifest or None
+        Plots whose inputs are unchanged since they were recorded in the
+        manifest are not rendered again. The rendered plots are recorded.
 
     Returns
     -------
@@ -102,7 +326,11 @@ def create_series_violin_plots(
     """
     scale = 1000  # value to convert M to mM
 
-    data_frames = compound_wise_dataframes(data_report_list, data_names=series_values)
+    data_frame = long_form_dataframe(
+        data_report_list, data_names=series_values, scale=scale
+    )
+
+    p_value_indices = [compound_index(p_val) for p_val in p_values]
 
     pair_names = []
     pair_names_str = []
@@ -110,75 +338,81 @@ def create_series_violin_plots(
         pair_names.append((series_values[p[0]], series_values[p[1]]))
         pair_names_str.append((str(series_values[p[0]]), str(series_values[p[1]])))
 
-    for compound in data_frames:
-        df = data_frames[compound] * scale
+    jobs = []
+    for compound, df in compound_groups(data_frame).items():
+        order = [*df["series"].unique()]
 
-        df.rename(columns={"A": "a", "B": "c"})
-        if len(list(df)) < 3:
+        if len(order) < 3:
             pass
         else:
-            fig, ax = plt.subplots(figsize=(6.5, 4.5), frameon=True)
-
             plot_colour = compound_colours[compound]
 
             palette = []
-            n = len(df.columns)
+            n = len(order)
             for x in range(0, n):
                 palette.append(colorFader(plot_colour, "#c5c9c7", x / n))
 
-            ax = sns.violinplot(
-                data=df,
-                width=1,
-                palette=palette,
-                inner="box",
-                saturation=0.3,
-            )
+            p = []
 
-            sns.boxplot(
-                data=df,
-                width=0.1,
-                palette=palette,
-                boxprops={"zorder": 2},
-                ax=ax,
-            )
+            for p_val, p_index, _ in zip(p_values, p_value_indices, pairs):
+                if compound in p_index:
+                    p.append(p_val[p_index[compound]])
 
-            p = []
+            title = names[compound] + " ," + index[compound]
+            output_filename = filename + f"_{compound}_index_{index[compound]}.png"
 
-            for p_val, _ in zip(p_values, pairs):
-                token = "not_present"
-                for x in p_val:
-                    if compound in x:
-                        token = x
-                if token in p_val:
-                    p.append(p_val[token])
-
-            annotator = Annotator(ax, pair_names, data=df)
-            annotator.set_pvalues(p)
-            annotator.annotate()
-
-            plt.xticks(rotation=0, fontweight="bold", fontsize=20)
-            plt.yticks(fontsize=23)
-
-            plt.xlabel(x_label, fontweight="bold", fontsize=23)
-            plt.ylabel("concentration/ mM", fontsize=23, fontweight="bold")
-            plt.title(
-                names[compound] + " ," + index[compound], fontsize=20, fontweight="bold"
+            jobs.append(
+                (
+                    df,
+                    order,
+                    palette,
+                    pair_names_str,
+                    p,
+                    x_label,
+                    title,
+                    output_filename,
+                )
             )
-            sns.set(font_scale=1.8)
-            sns.set_style("ticks")
 
-            plt.tight_layout()
-            output_filename = filename + f"_{compound}_index_{index[compound]}.png"
-            plt.savefig(output_filename)
-            plt.close()
-            print(f"Plot written to {output_filename}")
+    keys = dict()
+    if manifest is not None:
+        keys = {job[7]: output_manifest.input_hash(*job) for job in jobs}
+        for output in [o for o in keys if manifest.is_current(o, keys[o])]:
+            print(f"Plot up to date: {output}")
+            del keys[output]
+        jobs = [job for job in jobs if job[7] in keys]
+
+    parallel.map_jobs(render_violin_plot, jobs, workers)
+
+    for output, key in keys.items():
+        manifest.record(output, key)
 
 
-def dendrogram_plot(Z, i, filename):
+def dendrogram_plot(Z, i, filename, support=None):
+    """
+    Plot a dendrogram and save it as a .png file.
+
+    Parameters
+    ----------
+    Z: numpy array
+        Linkage matrix (see scipy.cluster.hierarchy.linkage).
+    i: list
+        Leaf labels.
+    filename: str
+        Output filename without extension.
+    support: dict or None
+        Support values of the nodes, e.g. from
+        clustering.multiscale_bootstrap. The AU ("au") and BP ("bp") values
+        per row of Z are written next to the nodes in percent.
+
+    Returns
+    -------
+    None
+    """
 
     fig = plt.figure(figsize=(14, 2))
 
-    dendrogram(
+    tree = dendrogram(
         Z,
         leaf_rotation=0,
         leaf_font_size=20,
@@ -187,6 +421,32 @@ def dendrogram_plot(Z, i, filename):
         above_threshold_color="k",
     )
 
+    if support is not None:
+        # leaves are drawn at x = 5, 15, 25, ... and nodes at the midpoint of
+        # their children
+        n = len(Z) + 1
+        x = np.zeros(2 * n - 1)
+        x[tree["leaves"]] = 5 + 10 * np.arange(n)
+        for node, (a, b) in enumerate(np.asarray(Z[:, :2], dtype=int)):
+            x[n + node] = (x[a] + x[b]) / 2
+
+            for value, colour, align in (
+                (support["au"][node], "tab:red", "right"),
+                (support["bp"][node], "tab:green", "left"),
+            ):
+                plt.annotate(
+                    f"{100 * value:.0f}",
+                    (x[n + node], Z[node, 2]),
+                    xytext=(-2 if align == "right" else 2, 2),
+                    textcoords="offset points",
+                    ha=align,
+                    fontsize=7,
+                    color=colour,
+                )
+
+        # room for the labels of the root
+        plt.ylim(top=1.15 * Z[:, 2].max())
+
     plt.tick_params(axis="x", which="major", labelsize=15)
     plt.xticks(fontweight="bold")
     plt.yticks([])
@@ -225,37 +485,12 @@ def corr(val, flow, index, interval, name, store_folder):
     dest_dir = store_folder / "time_correlation_analysis"
     os.makedirs(dest_dir, exist_ok=True)
 
-    all_corr = []
-    for a, x in enumerate(flow):
-        corr = []
-        for y in val[a]:
-            c = stats.pearsonr(y, x[0])
-            corr.append(c[0])
-        all_corr.append(corr)
-
-    flat = np.array(all_corr).flatten()
-    if np.amax(flat) > abs(np.amin(flat)):
-        value = np.amax(flat)
-        corr_range = [-value, value]
-    elif abs(np.amin(flat)) > np.amax(flat):
-        value = abs(np.amin(flat))
-        corr_range = [-value, value]
-
-    mult = 360 / (abs(corr_range[0]) + corr_range[1])
-    cmap = mpl.colors.LinearSegmentedColormap.from_list(
-        "",
-        ["midnightblue", "#0000D6", "lightskyblue", "white", "pink", "red", "maroon"],
-        N=360,
-    )
+    all_corr = correlation(val, flow, interval)
 
     i = ["compound_index"] + index
 
     for a, x in enumerate(interval):
-        l = all_corr[a]
-        l_col = [["correlation_value", "hex_colour"]]
-        for y in l:
-            conv_val = 360 - (y + corr_range[1]) * mult
-            l_col.append([y, mcolors.rgb2hex(cmap(360 - int(conv_val)))])
+        l_col = [["correlation_value", "hex_colour"]] + all_corr[a]
 
         dic_s = dict(zip(i, l_col))
         all_data = pd.DataFrame(dic_s)
@@ -0,0 +1,470 @@
+"""
+Resampling methods for significance tests and confidence intervals.
+
+The differentials of the correlation analysis are autocorrelated time
+series, so the parametric p-values of the Pearson correlation are too small.
+Their null distribution is sampled with surrogates of the flow differential
+that keep its autocorrelation: circular shifts, permutations of blocks or a
+moving block bootstrap.
+
+Confidence intervals of averages and relative shifts are estimated with the
+(block) bootstrap of the timepoints of each experiment.
+"""
+
+import numpy as np
+
+from processing_scripts_formose import parallel
+from processing_scripts_formose.data_analysis_functions import (
+    normalized_deviations,
+    relative_difference,
+)
+
+SURROGATE_METHODS = ["circular", "block", "block_bootstrap"]
+# number of surrogates per job sent to the worker processes
+CHUNK_SIZE = 1000
+
+
+def default_block_size(n_points):
+    """
+    Get the default block size for block surrogates, n_points^(1/3).
+
+    Parameters
+    ----------
+    n_points: int
+
+    Returns
+    -------
+    block_size: int
+    """
+
+    return max(1, int(round(n_points ** (1 / 3))))
+
+
+def surrogate_indices(
+    n_points, n_surrogates, rng, method="circular", block_size=1, length=None
+):
+    """
+    Create the time indices of surrogate series.
+
+    Parameters
+    ----------
+    n_points: int
+        Length of the series.
+    n_surrogates: int
+    rng: numpy Generator
+    method: str
+        "circular": the series is shifted circularly by a random, non-zero
+        number of points.
+        "block": the order of blocks of block_size points is permuted.
+        "block_bootstrap": blocks of block_size points starting at random
+        points are drawn with replacement.
+    block_size: int
+    length: int or None
+        Length of the surrogate series for "block_bootstrap", n_points if
+        None. The other methods keep the length of the series.
+
+    Returns
+    -------
+    indices: numpy array
+        Surrogate x time array.
+    """
+
+    points = np.arange(n_points)
+
+    if method == "circular":
+        shifts = rng.integers(1, n_points, size=n_surrogates)
+        return (points + shifts[:, np.newaxis]) % n_points
+
+    block_size = min(block_size, n_points)
+    n_blocks = -(-n_points // block_size)
+    offsets = np.arange(block_size)
+
+    if method == "block":
+        order = np.argsort(rng.random((n_surrogates, n_blocks)), axis=1)
+        indices = (order[:, :, np.newaxis] * block_size + offsets).reshape(
+            n_surrogates, -1
+        )
+        # the last block is shorter when block_size does not divide n_points
+        return indices[indices < n_points].reshape(n_surrogates, n_points)
+    elif method == "block_bootstrap":
+        if length is None:
+            length = n_points
+        n_blocks = -(-length // block_size)
+        starts = rng.integers(
+            0, n_points - block_size + 1, size=(n_surrogates, n_blocks)
+        )
+        indices = (starts[:, :, np.newaxis] + offsets).reshape(n_surrogates, -1)
+        return indices[:, :length]
+
+    raise ValueError(f"Unknown surrogate method: {method}")
+
+
+def null_exceedances(job):
+    """
+    Count the surrogate correlations at least as large (in absolute value)
+    as the observed correlations.
+
+    Used by the worker processes of correlation_p_values.
+
+    Parameters
+    ----------
+    job: tuple
+        Normalized compound x time differentials, normalized flow
+        differential, observed correlations, method, block_size, number of
+        surrogates and numpy SeedSequence.
+
+    Returns
+    -------
+    counts: numpy array
+        One count per compound.
+    """
+
+    values, flow, observed, method, block_size, n_surrogates, seed = job
+    rng = np.random.default_rng(seed)
+
+    surrogates = flow[
+        surrogate_indices(len(flow), n_surrogates, rng, method, block_size)
+    ]
+    if method == "block_bootstrap":
+        # resampled series have a different mean and length
+        surrogates = normalized_deviations(surrogates)
+
+    null = np.abs(surrogates @ values.T)
+    # tolerance for rounding errors in surrogates equal to the observed series
+    threshold = np.abs(observed) * (1 - 1e-12)
+
+    return (null >= threshold).sum(axis=0)
+
+
+def correlation_p_values(
+    val,
+    flow,
+    n_surrogates=10000,
+    method="circular",
+    block_size=None,
+    seed=0,
+    workers=1,
+):
+    """
+    Find two-sided p-values of the Pearson correlations between the compound
+    and flow differentials (see data_analysis_functions.correlation) from
+    surrogates of the flow differential.
+
+    The surrogates are drawn in chunks from independent random streams
+    spawned from seed, so the results do not depend on the number of
+    workers.
+
+    Parameters
+    ----------
+    val: list of list of lists with respectively time intervals, compound differential and values in the differential
+    flow: list of list of lists with respectively time intervals, input flow differential and values in the differential
+    n_surrogates: int
+        Number of surrogates per time interval.
+    method: str
+        "circular", "block" or "block_bootstrap" (see surrogate_indices).
+    block_size: int, list[int] or None
+        Block size in samples, for all or per time interval. The cube root of
+        the length of the differential if None.
+    seed: int or None
+    workers: int or None
+        Number of worker processes, 1 runs in this process. None uses
+        all available cores.
+
+    Returns
+    -------
+    p_values: numpy array
+        Interval x compound array.
+    """
+
+    if method not in SURROGATE_METHODS:
+        raise ValueError(f"Unknown surrogate method: {method}")
+
+    if not isinstance(block_size, (list, tuple, np.ndarray)):
+        block_size = [block_size] * len(flow)
+
+    n_chunks = -(-n_surrogates // CHUNK_SIZE)
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(flow) * n_chunks))
+
+    jobs = []
+    intervals = []
+    for values, x, size in zip(val, flow, block_size):
+        y = normalized_deviations(x[0])
+        values = np.array(values, dtype=float).reshape(len(values), len(y))
+        values = normalized_deviations(values)
+        observed = values @ y
+        if size is None:
+            size = default_block_size(len(y))
+
+        interval_seeds = [next(seeds) for _ in range(n_chunks)]
+        if len(y) < 2:
+            # no surrogates of a single point
+            intervals.append((observed, None))
+            continue
+
+        intervals.append((observed, len(jobs)))
+
+        for c, s in enumerate(interval_seeds):
+            n = min(CHUNK_SIZE, n_surrogates - c * CHUNK_SIZE)
+            jobs.append((values, y, observed, method, size, n, s))
+
+    counts = parallel.map_jobs(null_exceedances, jobs, workers)
+
+    n_compounds = max([len(o) for o, _ in intervals], default=0)
+    p_values = np.full((len(flow), n_compounds), np.nan)
+    for a, (observed, first) in enumerate(intervals):
+        if first is None:
+            continue
+
+        exceedances = np.sum(counts[first : first + n_chunks], axis=0)
+        p = (exceedances + 1) / (n_surrogates + 1)
+        p_values[a, : len(observed)] = np.where(np.isnan(observed), np.nan, p)
+
+    return p_values
+
+
+def resampled_means(job):
+    """
+    Calculate the averages, and the averages of the non-zero values, of
+    bootstrap resamples of the timepoints of a compound x time array.
+
+    Each resample is a row of an index matrix, reduced to the number of times
+    each timepoint is drawn, so the averages of all resamples are a single
+    matrix product. Used by the worker processes of bootstrap_means.
+
+    Parameters
+    ----------
+    job: tuple
+        Compound x time array (without missing values), block size, number of
+        resamples and numpy SeedSequence.
+
+    Returns
+    -------
+    means, nonzero_means: numpy arrays
+        Resample x compound arrays.
+    """
+
+    values, block_size, n_resamples, seed = job
+    rng = np.random.default_rng(seed)
+    n_points = values.shape[1]
+
+    indices = surrogate_indices(
+        n_points, n_resamples, rng, method="block_bootstrap", block_size=block_size
+    )
+    rows = np.repeat(np.arange(n_resamples), n_points)
+    counts = np.bincount(
+        rows * n_points + indices.ravel(), minlength=n_resamples * n_points
+    ).reshape(n_resamples, n_points)
+
+    nonzero = (values != 0).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = counts @ values.T / n_points
+        nonzero_means = (counts @ values.T) / (counts @ nonzero.T)
+
+    return means, nonzero_means
+
+
+def bootstrap_means(samples, n_resamples=10000, block_size=1, seed=0, workers=1):
+    """
+    Draw bootstrap resamples of the timepoints of each sample and calculate
+    the averages of the compounds.
+
+    The resamples are drawn in chunks from independent random streams spawned
+    from seed and distributed over the process pool, so the results do not
+    depend on the number of workers.
+
+    Parameters
+    ----------
+    samples: list[numpy array] or numpy array
+        Compound x time arrays, or an experiment x compound x time array.
+        Timepoints missing for all compounds (padding) are left out, compounds
+        with missing values give nan.
+    n_resamples: int
+    block_size: int or None
+        1 resamples single timepoints, larger blocks keep the
+        autocorrelation of the traces (moving block bootstrap). The cube root
+        of the number of timepoints if None.
+    seed: int or None
+    workers: int or None
+        Number of worker processes, 1 runs in this process. None uses
+        all available cores.
+
+    Returns
+    -------
+    means, nonzero_means: list[numpy array]
+        Per sample, resample x compound arrays of the averages and of the
+        averages of the non-zero values.
+    """
+
+    n_chunks = -(-n_resamples // CHUNK_SIZE)
+    seeds = iter(np.random.SeedSequence(seed).spawn(len(samples) * n_chunks))
+
+    jobs = []
+    missing = []
+    for sample in samples:
+        sample = np.asarray(sample, dtype=float)
+        sample = sample[:, ~np.isnan(sample).all(axis=0)]
+        missing.append(np.isnan(sample).any(axis=1))
+
+        size = block_size
+        if size is None:
+            size = default_block_size(sample.shape[1])
+
+        for c in range(n_chunks):
+            n = min(CHUNK_SIZE, n_resamples - c * CHUNK_SIZE)
+            jobs.append((np.nan_to_num(sample), size, n, next(seeds)))
+
+    results = parallel.map_jobs(resampled_means, jobs, workers)
+
+    means = []
+    nonzero_means = []
+    for s, rows in enumerate(missing):
+        chunks = results[s * n_chunks : (s + 1) * n_chunks]
+        for resamples, output in zip(zip(*chunks), (means, nonzero_means)):
+            resamples = np.concatenate(resamples, axis=0)
+            resamples[:, rows] = np.nan
+            output.append(resamples)
+
+    return means, nonzero_means
+
+
+def percentile_interval(resamples, level=0.95):
+    """
+    Get the percentile confidence interval from bootstrap resamples.
+
+    Infinite and undefined (nan) resamples are left out. Where no resample
+    is finite, e.g. for the shifts of compounds absent from the reference
+    experiment (see data_analysis_functions.relative_shifts), both bounds are
+    the value of the first resample.
+
+    Parameters
+    ----------
+    resamples: numpy array
+        Resamples along the first axis.
+    level: float
+        Confidence level, between 0 and 1.
+
+    Returns
+    -------
+    lower, upper: numpy arrays
+    """
+
+    resamples = np.asarray(resamples, dtype=float)
+    finite = np.isfinite(resamples)
+    defined = finite.any(axis=0)
+
+    # the columns without finite resamples are filled in afterwards
+    masked = np.where(finite, resamples, np.nan)
+    masked = np.where(defined, masked, 0.0)
+
+    tail = 100 * (1 - level) / 2
+    lower, upper = np.nanpercentile(masked, [tail, 100 - tail], axis=0)
+
+    lower = np.where(defined, lower, resamples[0])
+    upper = np.where(defined, upper, resamples[0])
+
+    return lower, upper
+
+
+def mean_confidence_intervals(
+    samples, level=0.95, n_resamples=10000, block_size=1, seed=0, workers=1
+):
+    """
+    Find bootstrap confidence intervals of the averages of the compound
+    traces (see bootstrap_means).
+
+    Parameters
+    ----------
+    samples: list[numpy array] or numpy array
+        Compound x time arrays, e.g. data_report.data.array, or an experiment
+        x compound x time array.
+    level: float
+        Confidence level, between 0 and 1.
+    n_resamples: int
+    block_size: int or None
+    seed: int or None
+    workers: int or None
+
+    Returns
+    -------
+    intervals: list[tuple(numpy array, numpy array)]
+        Per sample, the lower and upper bounds per compound.
+    """
+
+    means, _ = bootstrap_means(
+        samples,
+        n_resamples=n_resamples,
+        block_size=block_size,
+        seed=seed,
+        workers=workers,
+    )
+
+    return [percentile_interval(m, level) for m in means]
+
+
+def shift_confidence_intervals(
+    traces,
+    present,
+    pairs,
+    level=0.95,
+    n_resamples=10000,
+    block_size=1,
+    seed=0,
+    workers=1,
+):
+    """
+    Find bootstrap confidence intervals of the relative shifts between pairs
+    of reference and perturbed experiments (see
+    data_analysis_functions.relative_shifts). The timepoints of both
+    experiments are resampled independently.
+
+    Parameters
+    ----------
+    traces: numpy array
+        Experiment x compound x time array, e.g. from
+        experiment_store.compound_traces.
+    present: numpy array
+        Experiment x compound boolean array.
+    pairs: list[tuple(int, int)]
+        Experiment indices of the reference and perturbed experiments.
+    level: float
+        Confidence level, between 0 and 1.
+    n_resamples: int
+    block_size: int or None
+    seed: int or None
+    workers: int or None
+
+    Returns
+    -------
+    lower, upper: numpy arrays
+        Pair x compound arrays, nan where the shift is undefined in all
+        resamples.
+    """
+
+    _, nonzero_means = bootstrap_means(
+        traces,
+        n_resamples=n_resamples,
+        block_size=block_size,
+        seed=seed,
+        workers=workers,
+    )
+
+    lower = np.full((len(pairs), traces.shape[1]), np.nan)
+    upper = np.full((len(pairs), traces.shape[1]), np.nan)
+    for p, (reference, perturbed) in enumerate(pairs):
+        shifts = relative_difference(
+            nonzero_means[reference],
+            nonzero_means[perturbed],
+            present[reference],
+            present[perturbed],
+        )
+        # resamples drawing only zeros of a present compound have no average,
+        # so their shifts are undefined rather than 0 (compounds absent from
+        # the perturbed experiment keep their shift of 0)
+        undefined = present[perturbed] & (
+            np.isnan(nonzero_means[perturbed])
+            | (present[reference] & np.isnan(nonzero_means[reference]))
+        )
+        shifts = np.where(undefined, np.nan, shifts)
+        lower[p], upper[p] = percentile_interval(shifts, level)
+
+    return lower, upper